@@ -9,6 +9,7 @@ import time
 from threading import Thread
 import xml.etree.ElementTree as ET
 import socket
+import struct
 import threading
 import sumolib
 import random
@@ -17,8 +18,24 @@ from utilities.road_closure_handler import RoadClosureHandler
 from utilities.prompt_manager import PromptManager
 from utilities.activity_chain_modifier import ActivityChainModifier
 from utilities.event_handler import EventHandler
+from utilities import json_codec
 from datetime import datetime
 
+COMMAND_RECV_SIZE = 65536
+
+def split_commands(buf):
+    """Remove the complete newline-terminated commands from buf and return them decoded
+
+    An incomplete trailing command is left in buf for the next read, and lines are
+    only decoded once split out so a multi-byte character is never cut in half.
+    """
+    end = buf.rfind(b"\n")
+    if end == -1:
+        return []
+    lines = bytes(buf[:end]).split(b"\n")
+    del buf[:end + 1]
+    return [line.rstrip(b"\r").decode("utf-8", errors="replace") for line in lines]
+
 class SUMOController:
     def __init__(self):
         self.running = True
@@ -28,6 +45,8 @@ class SUMOController:
         self.total_steps = self.end_time - self.start_time
         self.viewer_socket = None
         self.server_socket = None
+        # Bytes received from the viewer that don't yet form a complete command
+        self._cmd_buf = bytearray()
         self.start_socket_server()
         
         # Initialize handlers
@@ -69,6 +88,7 @@ class SUMOController:
             while self.running:
                 try:
                     client, addr = self.server_socket.accept()
+                    self._cmd_buf = bytearray()
                     self.viewer_socket = client
                     print("Viewer connected")
                 except:
@@ -293,10 +313,14 @@ class SUMOController:
                     # Check for commands from viewer
                     try:
                         self.viewer_socket.settimeout(0)  # Non-blocking
-                        command = self.viewer_socket.recv(1024).decode()
+                        self._cmd_buf += self.viewer_socket.recv(COMMAND_RECV_SIZE)
                         
-                        # Only process command if we actually received data
-                        if command:
+                        # Commands are newline-terminated; a read may carry several, or end mid-command
+                        for command in split_commands(self._cmd_buf):
+                            # Skip blank lines between commands
+                            if not command:
+                                continue
+                            
                             print(f"Received command: {command}")  # Debug print
                             if command.startswith("HIGHLIGHT:"):
                                 # Reset previous highlighted vehicle
@@ -395,13 +419,13 @@ class SUMOController:
                                 # Prepare message
                                 try:
                                     # Convert to JSON
-                                    json_message = json.dumps(data, ensure_ascii=False)
+                                    json_message = json_codec.dumps(data)
                                     
-                                    # Add specific markers with clear separation
-                                    full_message = "<<START>>" + json_message + "<<END>>"
+                                    # Start marker, then a 4-byte big-endian length, then the payload
+                                    full_message = b"<<START>>" + struct.pack('>I', len(json_message)) + json_message
                                     
                                     # Send in one operation
-                                    self.viewer_socket.sendall(full_message.encode('utf-8'))
+                                    self.viewer_socket.sendall(full_message)
                                     print(f"Sent density data for {count} vehicles directly")
                                 except Exception as e:
                                     print(f"Error sending density data: {e}")
@@ -494,6 +518,7 @@ class SUMOController:
 
     def cleanup(self):
         self.running = False
+        self.road_closure_handler.close()
         if self.viewer_socket:
             try:
                 self.viewer_socket.close()
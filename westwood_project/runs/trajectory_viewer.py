@@ -1,13 +1,20 @@
 import tkinter as tk
-from tkinter import ttk, messagebox
+from tkinter import ttk
 import traci
 import json
 import threading
+import queue
 import time
+import traceback
+import logging
 import subprocess
 import os
 import socket
+import selectors
 import math
+from operator import itemgetter
+import numpy as np
+import pyproj
 # Add parent directory to path for utilities imports
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -16,6 +23,59 @@ from utilities.activity_chain_modifier import ActivityChainModifier
 from utilities.event_handler import EventHandler
 from utilities.road_closure_handler import RoadClosureHandler
 from utilities.prompt_manager import PromptManager
+from utilities import json_codec
+
+log = logging.getLogger("trajectory_viewer")
+
+# Set MOBIVERSE_DEBUG=1 to print full tracebacks for handled errors
+DEBUG = bool(int(os.environ.get("MOBIVERSE_DEBUG", "0")))
+
+# Network offset constants of westwood.net.xml
+NET_OFFSET_X = -365398.86
+NET_OFFSET_Y = -3768588.46
+
+# Viewer protocol: SUMO terminates each JSON message with FRAME_END
+FRAME_END = b"<<END>>"
+RECV_SIZE = 65536
+
+# Widgets are refreshed from the newest pending data at most this often (~30 Hz)
+UI_FRAME_MS = 33
+SOCKET_BUFFER_SIZE = 4 << 20
+SOCKET_USER_TIMEOUT_MS = 2000
+
+# Number of route edges shown before/after the current one in "Route Details"
+ROUTE_EDGES_BEFORE = 50
+ROUTE_EDGES_AFTER = 150
+
+# Built once; constructing a pyproj Transformer is far more expensive than using it
+_TRANSFORMER = pyproj.Transformer.from_crs(
+    "+proj=utm +zone=11 +ellps=WGS84 +datum=WGS84 +units=m +no_defs",
+    "+proj=longlat +ellps=WGS84 +datum=WGS84 +no_defs",
+    always_xy=True
+)
+
+def take_latest_frame(buf, offset=0):
+    """Remove all complete FRAME_END-terminated messages from buf and return the newest
+
+    Only bytes from offset on are searched for a new terminator. Returns the message
+    (None if no message is complete) and the offset to search from after the next read.
+    """
+    message = None
+    end = buf.rfind(FRAME_END, offset)
+    if end != -1:
+        start = buf.rfind(FRAME_END, 0, end)
+        start = 0 if start == -1 else start + len(FRAME_END)
+        message = buf[start:end]
+        del buf[:end + len(FRAME_END)]
+    # A terminator may straddle the boundary with the next read
+    return message, max(0, len(buf) - len(FRAME_END) + 1)
+
+def _parse_csv(text):
+    """Split a comma separated entry into its non-empty, stripped items"""
+    if " " not in text:
+        # Fast path: nothing to strip
+        return [item for item in text.split(",") if item]
+    return [item for item in (part.strip() for part in text.split(",")) if item]
 
 class TrajectoryViewer:
     def __init__(self, root):
@@ -23,31 +83,21 @@ class TrajectoryViewer:
         self.root.title("SUMO Trajectory Viewer")
         self.root.geometry("500x800")  # Reduced height for smaller screens
         
-        # Create a canvas with scrollbar for the entire GUI
-        self.canvas = tk.Canvas(self.root)
-        self.scrollbar = ttk.Scrollbar(self.root, orient="vertical", command=self.canvas.yview)
-        self.scrollable_frame = ttk.Frame(self.canvas)
-        
-        self.scrollable_frame.bind(
-            "<Configure>",
-            lambda e: self.canvas.configure(scrollregion=self.canvas.bbox("all"))
-        )
-        
-        self.canvas.create_window((0, 0), window=self.scrollable_frame, anchor="nw")
-        self.canvas.configure(yscrollcommand=self.scrollbar.set)
-        
-        # Pack the canvas and scrollbar
-        self.canvas.pack(side="left", fill="both", expand=True)
-        self.scrollbar.pack(side="right", fill="y")
-        
-        # Bind mouse wheel to scroll
-        self.canvas.bind_all("<MouseWheel>", self._on_mousewheel)
+        # Main frame holding the whole GUI; it is only wrapped in a scrolling
+        # canvas by _fit_to_screen() when it does not fit on the screen
+        self.canvas = None
+        self.scrollbar = None
+        self.scrollable_frame = ttk.Frame(self.root)
         
         # Initialize activity chain modifier
         self.activity_modifier = ActivityChainModifier()
         
-        # Initialize last_vehicle_data
-        self.last_vehicle_data = {'vehicle_data': {}}
+        # Initialize last_vehicle_data; two dicts are reused alternately so a
+        # new message refills the idle one instead of replacing the object
+        self._vd_buffers = [{'vehicle_data': {}}, {}]
+        self._vd_idx = 0
+        self._vd_lock = threading.Lock()
+        self.last_vehicle_data = self._vd_buffers[0]
         
         # Agent selection
         self.agent_frame = ttk.LabelFrame(self.scrollable_frame, text="Agent Selection", padding="5")
@@ -252,7 +302,7 @@ class TrajectoryViewer:
             self.poi_combo['values'] = poi_names
             
         except Exception as e:
-            print(f"Error loading POIs from XML: {e}")
+            log.warning("Error loading POIs from XML: %s", e)
             self.pois = []
             self.poi_combo['values'] = []
         
@@ -300,54 +350,141 @@ class TrajectoryViewer:
         self.update_thread = None
         self.socket = None
         
+        # LLM requests are served one at a time by a single worker thread;
+        # identical (agent, prompt) requests that are still pending are dropped.
+        # Repeated prompts are answered by the activity modifier's TTL reply cache.
+        self._llm_q = queue.Queue(maxsize=4)
+        self._llm_inflight = set()
+        self._llm_lock = threading.Lock()
+        self._llm_thread = threading.Thread(target=self._llm_worker, daemon=True)
+        self._llm_thread.start()
+        
+        # Latest data waiting to be drawn, written by the update thread and
+        # consumed by _pump() on the Tk thread
+        self._dirty = {}
+        self._shown_demographics = object()
+        
+        # Last (POI sequence, durations) sent per agent with CHANGE_ROUTE
+        self._last_sent_chain = {}
+        
+        # Pipe used to wake the update thread out of select()
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        
+        # Receive buffer and the position from which to search it for FRAME_END
+        self._rxbuf = bytearray()
+        self._rx_offset = 0
+        
+        # Outgoing commands, queued by _send_cmd and written by the update thread
+        # whenever the non-blocking socket is writable
+        self._txbuf = bytearray()
+        self._tx_lock = threading.Lock()
+        
+        # Lookup tables for the tracked agent's route, rebuilt when the route changes
+        self._route_key = None
+        self._route_id = 0
+        self._first_edge_pos = {}
+        self._last_edge_pos = {}
+        self._last_real_before = []
+        self._edge_resolve_cache = {}
+        
+        # Status updates are coalesced and written once per idle cycle; a dict keeps
+        # the distinct pending messages in arrival order
+        self._status_lock = threading.Lock()
+        self._pending_status = {}
+        self._status_scheduled = False
+        # Registered once as a Tcl command so scheduling a flush is a single Tcl call
+        self._flush_cb = self.root.register(self._flush_status)
+        
         # Initial status message with styling
-        self.status_text.delete(1.0, "end")
-        self.status_text.insert("end", "Status: ", "title")
-        self.status_text.insert("end", "Click 'Connect' to connect to SUMO simulation\n", "normal")
+        self.status_text.replace(1.0, "end", "Status: ", "title",
+                                 "Click 'Connect' to connect to SUMO simulation\n", "normal")
+        
+        self._fit_to_screen()
+        self.root.after(UI_FRAME_MS, self._pump)
+    
+    def _fit_to_screen(self):
+        """Pack the main frame directly, or inside a scrolling canvas if it is taller than the screen"""
+        self.root.update_idletasks()
+        if self.scrollable_frame.winfo_reqheight() <= self.root.winfo_screenheight():
+            self.scrollable_frame.pack(fill="both", expand=True)
+            return
+        
+        # The frame is a child of root, which Tk allows as a canvas window
+        self.canvas = tk.Canvas(self.root)
+        self.scrollbar = ttk.Scrollbar(self.root, orient="vertical", command=self.canvas.yview)
+        self.scrollable_frame.bind(
+            "<Configure>",
+            lambda e: self.canvas.configure(scrollregion=self.canvas.bbox("all"))
+        )
+        self.canvas.create_window((0, 0), window=self.scrollable_frame, anchor="nw")
+        self.canvas.configure(yscrollcommand=self.scrollbar.set)
+        
+        self.canvas.pack(side="left", fill="both", expand=True)
+        self.scrollbar.pack(side="right", fill="y")
+        self.scrollable_frame.lift(self.canvas)
+        
+        # Scroll only when the wheel is used over the canvas itself
+        self.canvas.bind("<MouseWheel>", self._on_mousewheel)
+        self.scrollable_frame.bind("<MouseWheel>", self._on_mousewheel)
     
     def _on_mousewheel(self, event):
         """Handle mouse wheel scrolling"""
-        self.canvas.yview_scroll(int(-1*(event.delta/120)), "units")
+        if self.canvas is not None:
+            self.canvas.yview_scroll(int(-1*(event.delta/120)), "units")
     
     def connect_to_sumo(self):
         try:
             if not self.connected:
-                self.status_text.delete(1.0, "end")
-                self.status_text.insert("end", "Attempting to connect to viewer socket...\n")
+                self.update_status("Attempting to connect to viewer socket...")
                 
                 try:
                     self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
                     self.socket.connect(('localhost', 8814))
+                    self._tune_socket(self.socket)
+                    self._rxbuf.clear()
+                    self._rx_offset = 0
+                    with self._tx_lock:
+                        self._txbuf.clear()
+                    self._last_sent_chain.clear()
                     self.connected = True
-                    self.status_text.delete(1.0, "end")
-                    self.status_text.insert("end", "Connected to SUMO simulation\n")
+                    self.update_status("Connected to SUMO simulation")
                     self.connect_button.config(text="Disconnect")
                     
-                    if not self.update_thread:
-                        self.update_thread = threading.Thread(target=self.update_loop)
-                        self.update_thread.start()
+                    # A previous update thread exits on its own once its socket is closed
+                    self.update_thread = threading.Thread(target=self.update_loop)
+                    self.update_thread.start()
                         
                 except Exception as e:
-                    self.status_text.delete(1.0, "end")
-                    self.status_text.insert("end", "Could not connect.\nMake sure SUMO is running first.\n")
+                    self.update_status("Could not connect.\nMake sure SUMO is running first.")
                     return
             else:
+                self.connected = False
                 try:
                     self.socket.close()
                 except:
                     pass
-                self.connected = False
-                self.status_text.delete(1.0, "end")
-                self.status_text.insert("end", "Disconnected from SUMO\n")
+                self._wake_update_loop()
+                self.update_status("Disconnected from SUMO")
                 self.connect_button.config(text="Connect")
         except Exception as e:
-            self.status_text.delete(1.0, "end")
-            self.status_text.insert("end", f"Connection error: {e}\n")
+            self.update_status(f"Connection error: {e}")
+    
+    def _tune_socket(self, sock):
+        """Set buffer sizes and latency options on the connection to SUMO"""
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        
+        # Linux only: ACK immediately, and fail fast if SUMO stops acknowledging data
+        if hasattr(socket, "TCP_QUICKACK"):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+        if hasattr(socket, "TCP_USER_TIMEOUT"):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_USER_TIMEOUT, SOCKET_USER_TIMEOUT_MS)
     
     def track_agent(self):
         if not self.connected:
-            self.status_text.delete(1.0, "end")
-            self.status_text.insert("end", "Please connect to SUMO first\n")
+            self.update_status("Please connect to SUMO first")
             return
         
         agent_id = self.agent_id_var.get()
@@ -358,19 +495,15 @@ class TrajectoryViewer:
         
         # Send highlight command to SUMO
         try:
-            command = f"HIGHLIGHT:{agent_id}"
-            # Use sendall to ensure the entire command is sent
-            self.socket.sendall(command.encode())
+            self._send_cmd("HIGHLIGHT", agent_id)
             
             # Wait a bit longer for the command to be processed
             time.sleep(0.2)  
             
-            self.status_text.delete(1.0, "end")
-            self.status_text.insert("end", f"Tracking agent {agent_id}\n")
+            self.update_status(f"Tracking agent {agent_id}")
         except Exception as e:
-            print(f"Failed to send highlight command: {e}")
-            self.status_text.delete(1.0, "end")
-            self.status_text.insert("end", f"Failed to track agent: {e}\n")
+            log.warning("Failed to send highlight command: %s", e)
+            self.update_status(f"Failed to track agent: {e}")
             # Try to reconnect if there was a socket error
             self.connect_to_sumo()
     
@@ -386,21 +519,15 @@ class TrajectoryViewer:
             pass
     
     def sumo_to_latlon(self, x, y):
-        net_offset_x = -365398.86
-        net_offset_y = -3768588.46
-        
-        utm_x = x - net_offset_x
-        utm_y = y - net_offset_y
-        
-        import pyproj
-        
-        utm_proj = pyproj.Proj("+proj=utm +zone=11 +ellps=WGS84 +datum=WGS84 +units=m +no_defs")
-        wgs84_proj = pyproj.Proj("+proj=longlat +ellps=WGS84 +datum=WGS84 +no_defs")
-        
-        transformer = pyproj.Transformer.from_proj(utm_proj, wgs84_proj)
-        lon, lat = transformer.transform(utm_x, utm_y)
-        
+        lon, lat = _TRANSFORMER.transform(x - NET_OFFSET_X, y - NET_OFFSET_Y)
         return lat, lon
+    
+    def latlon_batch(self, xs, ys):
+        """Convert arrays of SUMO x/y coordinates to lat/lon arrays in a single call"""
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        lons, lats = _TRANSFORMER.transform(xs - NET_OFFSET_X, ys - NET_OFFSET_Y)
+        return lats, lons
 
     def find_nearest_poi(self, x, y):
         nearest = None
@@ -430,6 +557,44 @@ class TrajectoryViewer:
     def find_pois_on_edge(self, edge_id):
         return [poi for poi in self.pois if poi.get('edge_id') == edge_id]
     
+    def _prepare_route(self, route):
+        """Rebuild the per-route lookup tables if the route differs from the last one seen"""
+        # Each message carries a fresh list, so compare one hash instead of the lists themselves
+        route_key = (len(route), hash(tuple(route)))
+        if route_key == self._route_key:
+            return
+        self._route_key = route_key
+        self._route_id += 1
+        self._edge_resolve_cache.clear()
+        
+        # First/last index of each edge, and the last non-internal edge up to each index.
+        # Interned edge ids make the dict lookups compare by pointer
+        self._first_edge_pos = {}
+        self._last_edge_pos = {}
+        self._last_real_before = []
+        last_real = None
+        for i, edge in enumerate(map(sys.intern, route)):
+            self._first_edge_pos.setdefault(edge, i)
+            self._last_edge_pos[edge] = i
+            if not edge.startswith(':'):
+                last_real = edge
+            self._last_real_before.append(last_real)
+    
+    def _resolve_internal_edge(self, current_edge):
+        """Return the last real edge driven before an internal edge, or the edge itself
+
+        The lookup tables must already be prepared for the message's route.
+        """
+        key = (self._route_id, current_edge)
+        resolved = self._edge_resolve_cache.get(key)
+        if resolved is None:
+            resolved = current_edge
+            route_idx = self._first_edge_pos.get(current_edge)
+            if route_idx is not None and self._last_real_before[route_idx] is not None:
+                resolved = self._last_real_before[route_idx]
+            self._edge_resolve_cache[key] = resolved
+        return resolved
+    
     def refresh_agents(self):
         """Update the dropdown with current available agents"""
         if not self.connected:
@@ -438,12 +603,12 @@ class TrajectoryViewer:
         
         try:
             # Send request for vehicle list
-            self.socket.send("GET_VEHICLES".encode())
+            self._send_cmd("GET_VEHICLES")
             # Wait briefly for response
             self.root.after(100)
             # The response will be handled in update_loop
         except Exception as e:
-            print(f"Failed to refresh agents: {e}")
+            log.warning("Failed to refresh agents: %s", e)
 
     def update_agent_list(self, vehicles):
         """Update the dropdown menu with new vehicle list"""
@@ -455,182 +620,296 @@ class TrajectoryViewer:
             self.agent_combo.set(vehicles[0])
 
     def update_loop(self):
-        """Main update loop for receiving and displaying data"""
-        buffer = ""
+        """Receive data from SUMO and schedule a display update for the newest message"""
+        sock = self.socket
+        chunk = memoryview(bytearray(RECV_SIZE))
+        sock.setblocking(False)
+        selector = selectors.DefaultSelector()
+        interest = selectors.EVENT_READ
+        selector.register(sock, interest)
+        # The wakeup pipe lets run(), disconnects and queued commands interrupt select()
+        selector.register(self._wake_r, selectors.EVENT_READ)
         
-        while self.running:
-            try:
-                # Increase buffer size and handle partial messages
-                data = self.socket.recv(16384).decode('utf-8', errors='ignore')
-                buffer += data
+        try:
+            while self.running and sock.fileno() != -1:
+                # Only ask for writability while commands are waiting to be sent
+                wanted = selectors.EVENT_READ | (selectors.EVENT_WRITE if self._txbuf else 0)
+                if wanted != interest:
+                    selector.modify(sock, wanted)
+                    interest = wanted
+                
+                events = selector.select(timeout=0.5)
+                ready = 0
+                for key, mask in events:
+                    if key.fileobj == self._wake_r:
+                        try:
+                            os.read(self._wake_r, 512)
+                        except BlockingIOError:
+                            pass
+                    else:
+                        ready = mask
                 
-                while "<<END>>" in buffer:
-                    message, buffer = buffer.split("<<END>>", 1)
+                if ready & selectors.EVENT_WRITE:
+                    self._flush_commands(sock)
+                if not ready & selectors.EVENT_READ:
+                    continue
+                
+                # Drain everything the kernel has buffered before rendering anything
+                closed = False
+                while True:
                     try:
-                        info = json.loads(message)
+                        n = sock.recv_into(chunk)
+                    except BlockingIOError:
+                        break
+                    except ConnectionResetError:
+                        closed = True
+                        break
+                    if not n:
+                        closed = True
+                        break
+                    self._rxbuf += chunk[:n]
+                
+                # Only the newest complete message is displayed, older ones are stale.
+                # Search just the bytes that arrived since the last scan.
+                message, self._rx_offset = take_latest_frame(self._rxbuf, self._rx_offset)
+                
+                if message is not None:
+                    try:
+                        info = json_codec.loads(message)
                         
                         # Store the last received data
-                        self.last_vehicle_data = info
-                        
-                        # Update agent list first
-                        if 'vehicles' in info:
-                            self.root.after(0, self.update_agent_list, info['vehicles'])
-                        
-                        # Clear previous text
-                        self.route_text.delete(1.0, "end")
-                        self.demographics_text.delete(1.0, "end")
-                        
-                        # Get tracked vehicle info
-                        if self.tracked_agent and self.tracked_agent in info['vehicle_data']:
-                            vehicle_data = info['vehicle_data'][self.tracked_agent]
-                            agent_info = vehicle_data.get('route_info', {})
-                            route = vehicle_data.get('route', [])
-                            current_edge = vehicle_data.get('current_edge', '')
-                            
-                            # Handle internal edges by finding the last real edge
-                            if current_edge.startswith(':'):
-                                try:
-                                    route_idx = route.index(current_edge)
-                                    route_until_now = route[:route_idx + 1]
-                                    real_edges = [edge for edge in route_until_now if not edge.startswith(':')]
-                                    if real_edges:
-                                        current_edge = real_edges[-1]
-                                except ValueError:
-                                    pass
-                            
-                            # Display basic info
-                            self.route_text.insert("end", f"Agent: {self.tracked_agent}\n", "title")
-                            self.route_text.insert("end", f"Time: {info['time']:.1f}\n", "normal")
-                            
-                            # Display position and speed
-                            speed = vehicle_data.get('speed', 0)
-                            # Handle position data correctly
-                            if 'lat_lon' in vehicle_data:
-                                lat, lon = vehicle_data['lat_lon'][:2]  # Get first two values (lat, lon)
-                            elif 'position' in vehicle_data:
-                                lat, lon = vehicle_data['position'][:2]  # Get first two values (x, y)
-                            else:
-                                lat, lon = 0, 0
-                            self.route_text.insert("end", f"Speed: {speed:.1f} m/s\n", "normal")
-                            self.route_text.insert("end", f"Position: ({lat:.6f}, {lon:.6f})\n", "normal")
-                            
-                            # Display demographics if available
-                            if 'demographics' in vehicle_data:
-                                self.update_demographics(vehicle_data['demographics'])
-                            else:
-                                self.demographics_text.delete(1.0, "end")
-                                self.demographics_text.insert("end", "No demographic information available\n")
-                            
-                            # Display POI sequence if available
-                            if agent_info and 'poi_sequence' in agent_info:
-                                # Display route source if available
-                                route_source = vehicle_data.get('route_source', 'Original')
-                                self.route_text.insert("end", f"\nPOI Sequence ({'LLM Modified'}):\n", "subtitle")
-                                
-                                # Sort POIs by order
-                                poi_sequence = sorted(agent_info['poi_sequence'], key=lambda x: x['order'])
-                                
-                                # Initialize visited_pois with the first POI
-                                visited_pois = []
-                                current_target = None
-                                
-                                # Find current position in sequence
-                                route_index = vehicle_data.get('route_index', 0)
-                                
-                                # Handle internal edges
-                                if current_edge.startswith(':'):
-                                    try:
-                                        if route_index + 1 < len(route):
-                                            current_edge = route[route_index + 1]
-                                    except Exception:
-                                        pass
-                                
-                                # Determine visited POIs and current target
-                                for i, poi in enumerate(poi_sequence):
-                                    if i == 0 or poi['edge'] in route[:route_index + 1]:
-                                        visited_pois.append(poi)
-                                    elif not current_target and poi['edge'] in route[route_index:]:
-                                        current_target = poi
-                                        break
-                                
-                                # Display POI sequence with proper status
-                                for poi in poi_sequence:
-                                    prefix = "✓ " if poi in visited_pois else "  "
-                                    activity = f"{poi.get('activity_type', 'Unknown'):12}"
-                                    order = f"{poi['order']}.".ljust(3)
-                                    duration = f"({poi.get('stop_duration', 30)}s)"
-                                    
-                                    if poi == current_target:
-                                        suffix = " ← Current Destination"
-                                        tag = "target"
-                                    elif poi['edge'] == current_edge:
-                                        suffix = " (Current Location)"
-                                        tag = "current"
-                                    elif poi in visited_pois:
-                                        suffix = ""
-                                        tag = "visited"
-                                    else:
-                                        suffix = ""
-                                        tag = "normal"
-                                    
-                                    self.route_text.insert("end", prefix, tag)
-                                    self.route_text.insert("end", activity, "activity")
-                                    
-                                    self.route_text.insert("end", f"\t\t\t{order} ", tag)
-                                    self.route_text.insert("end", poi['name'], tag)
-                                    #self.route_text.insert("end", f" {duration}", "normal")
-                                    # Display start and end time in 24-hour format
-                                    start_time = poi.get('start_time', 0)
-                                    end_time = poi.get('end_time', 0)
-                                    
-                                    # Convert seconds to HH:MM format
-                                    start_hours = start_time // 3600
-                                    start_minutes = (start_time % 3600) // 60
-                                    end_hours = end_time // 3600
-                                    end_minutes = (end_time % 3600) // 60
-                                    
-                                    time_str = f" [{start_hours:02d}:{start_minutes:02d}-{end_hours:02d}:{end_minutes:02d}]"
-                                    #self.route_text.insert("end", time_str, "normal")
-                                    self.route_text.insert("end", f"{suffix}\n", tag)
-                                
-                                # Show route details
-                                self.route_text.insert("end", "\nRoute Details:\n", "subtitle")
-                                for i, edge in enumerate(route):
-                                    if edge == current_edge:
-                                        self.route_text.insert("end", f"{i+1}. {edge} ← Current\n", "current")
-                                    else:
-                                        self.route_text.insert("end", f"{i+1}. {edge}\n", "normal")
-                            else:
-                                self.route_text.insert("end", f"Agent: {self.tracked_agent}\n", "title")
-                                self.route_text.insert("end", "No POI sequence information available\n", "normal")
-                            
+                        with self._vd_lock:
+                            buf = self._vd_buffers[self._vd_idx ^ 1]
+                            buf.clear()
+                            buf.update(info)
+                            self.last_vehicle_data = buf
+                            self._vd_idx ^= 1
+                        self._dirty['vehicles'] = True
                     except Exception as e:
-                        print(f"Error updating display: {e}")
-                        continue  # Skip this message and try the next one
-                    
-            except Exception as e:
-                print(f"Socket error: {e}")
-                if not self.running:  # Only break if we're meant to stop
+                        log.warning("Error decoding message: %s", e)
+                        if DEBUG:
+                            traceback.print_exc()
+                
+                if closed:
                     break
-                time.sleep(0.1)  # Wait a bit before retrying
-                continue
+        except OSError as e:
+            # The socket was closed under us (e.g. by a disconnect)
+            if self.running and self.connected:
+                log.warning("Socket error: %s", e)
+                if DEBUG:
+                    traceback.print_exc()
+        finally:
+            selector.close()
         
-        if self.connected:
+        if self.running and self.connected:
             self.root.after(0, self.handle_disconnect)
     
+    def _flush_commands(self, sock):
+        """Write as much of the queued command bytes as the socket accepts without blocking"""
+        with self._tx_lock:
+            try:
+                n = sock.send(self._txbuf)
+            except BlockingIOError:
+                return
+            del self._txbuf[:n]
+    
+    def _wake_update_loop(self):
+        """Interrupt a pending select() in the update thread"""
+        try:
+            os.write(self._wake_w, b"\0")
+        except OSError:
+            pass
+    
+    def _pump(self):
+        """Draw the newest pending data, then re-arm for the next frame"""
+        if self._dirty.pop('vehicles', False):
+            # Hold the lock so the buffer is not refilled while it is drawn
+            with self._vd_lock:
+                self.display_vehicle_data(self.last_vehicle_data)
+        if self.running:
+            self.root.after(UI_FRAME_MS, self._pump)
+    
+    def display_vehicle_data(self, info):
+        """Show the latest vehicle data in the GUI; runs on the Tk thread"""
+        try:
+            # Update agent list first
+            if 'vehicles' in info:
+                self.update_agent_list(info['vehicles'])
+            
+            # Skip all widget work unless the tracked agent is in this message
+            if not self.tracked_agent or self.tracked_agent not in info.get('vehicle_data', {}):
+                return
+            
+            # Text and tag pairs for the route widget, written in one call at the end
+            chunks = []
+            
+            # Get tracked vehicle info
+            vehicle_data = info['vehicle_data'][self.tracked_agent]
+            agent_info = vehicle_data.get('route_info', {})
+            route = vehicle_data.get('route', [])
+            current_edge = vehicle_data.get('current_edge', '')
+            self._prepare_route(route)
+            
+            # Handle internal edges by finding the last real edge
+            if current_edge.startswith(':'):
+                current_edge = self._resolve_internal_edge(current_edge)
+            
+            # Display basic info
+            chunks += (f"Agent: {self.tracked_agent}\n", "title")
+            chunks += (f"Time: {info['time']:.1f}\n", "normal")
+            
+            # Display position and speed
+            speed = vehicle_data.get('speed', 0)
+            # Handle position data correctly
+            if 'lat_lon' in vehicle_data:
+                lat, lon = vehicle_data['lat_lon'][:2]  # Get first two values (lat, lon)
+            elif 'position' in vehicle_data:
+                lat, lon = vehicle_data['position'][:2]  # Get first two values (x, y)
+            else:
+                lat, lon = 0, 0
+            chunks += (f"Speed: {speed:.1f} m/s\n", "normal")
+            chunks += (f"Position: ({lat:.6f}, {lon:.6f})\n", "normal")
+            
+            # Display demographics if available; they rarely change, so skip identical redraws
+            demographics = vehicle_data.get('demographics')
+            if demographics != self._shown_demographics:
+                self._shown_demographics = demographics
+                if demographics is not None:
+                    self.update_demographics(demographics)
+                else:
+                    self.demographics_text.replace(1.0, "end", "No demographic information available\n")
+            
+            # Display POI sequence if available
+            if agent_info and 'poi_sequence' in agent_info:
+                # Display route source if available
+                route_source = vehicle_data.get('route_source', 'Original')
+                chunks += (f"\nPOI Sequence ({'LLM Modified'}):\n", "subtitle")
+                
+                # Sort POIs by order
+                poi_sequence = sorted(agent_info['poi_sequence'], key=lambda x: x['order'])
+                
+                # Initialize visited_pois with the first POI
+                visited_pois = []
+                current_target = None
+                
+                # Find current position in sequence
+                route_index = vehicle_data.get('route_index', 0)
+                
+                # Handle internal edges
+                if current_edge.startswith(':'):
+                    try:
+                        if route_index + 1 < len(route):
+                            current_edge = route[route_index + 1]
+                    except Exception:
+                        pass
+                
+                # Determine visited POIs and current target; an edge is in
+                # route[:route_index + 1] if it first appears before that slice's
+                # end, and in route[route_index:] if it last appears at or after
+                # that slice's start (range slicing keeps negative-index semantics)
+                positions = range(len(route))
+                visited_end = len(positions[:route_index + 1])
+                remaining_start = positions[route_index:].start
+                first_pos = self._first_edge_pos
+                last_pos = self._last_edge_pos
+                for i, poi in enumerate(poi_sequence):
+                    if i == 0 or first_pos.get(poi['edge'], len(route)) < visited_end:
+                        visited_pois.append(poi)
+                    elif not current_target and last_pos.get(poi['edge'], -1) >= remaining_start:
+                        current_target = poi
+                        break
+                
+                # Display POI sequence with proper status
+                for poi in poi_sequence:
+                    prefix = "✓ " if poi in visited_pois else "  "
+                    activity = f"{poi.get('activity_type', 'Unknown'):12}"
+                    order = f"{poi['order']}.".ljust(3)
+                    duration = f"({poi.get('stop_duration', 30)}s)"
+                    
+                    if poi == current_target:
+                        suffix = " ← Current Destination"
+                        tag = "target"
+                    elif poi['edge'] == current_edge:
+                        suffix = " (Current Location)"
+                        tag = "current"
+                    elif poi in visited_pois:
+                        suffix = ""
+                        tag = "visited"
+                    else:
+                        suffix = ""
+                        tag = "normal"
+                    
+                    chunks += (prefix, tag)
+                    chunks += (activity, "activity")
+                    
+                    chunks += (f"\t\t\t{order} ", tag)
+                    chunks += (poi['name'], tag)
+                    #self.route_text.insert("end", f" {duration}", "normal")
+                    # Display start and end time in 24-hour format
+                    start_time = poi.get('start_time', 0)
+                    end_time = poi.get('end_time', 0)
+                    
+                    # Convert seconds to HH:MM format
+                    start_hours = start_time // 3600
+                    start_minutes = (start_time % 3600) // 60
+                    end_hours = end_time // 3600
+                    end_minutes = (end_time % 3600) // 60
+                    
+                    time_str = f" [{start_hours:02d}:{start_minutes:02d}-{end_hours:02d}:{end_minutes:02d}]"
+                    #self.route_text.insert("end", time_str, "normal")
+                    chunks += (f"{suffix}\n", tag)
+                
+                # Show route details, limited to a window around the current position
+                chunks += ("\nRoute Details:\n", "subtitle")
+                start = max(0, remaining_start - ROUTE_EDGES_BEFORE)
+                end = min(len(route), remaining_start + ROUTE_EDGES_AFTER)
+                if start > 0:
+                    chunks += (f"... ({start} earlier edges)\n", "normal")
+                for i in range(start, end):
+                    edge = route[i]
+                    if edge == current_edge:
+                        chunks += (f"{i+1}. {edge} ← Current\n", "current")
+                    else:
+                        chunks += (f"{i+1}. {edge}\n", "normal")
+                if end < len(route):
+                    chunks += (f"... ({len(route) - end} later edges)\n", "normal")
+            else:
+                chunks += (f"Agent: {self.tracked_agent}\n", "title")
+                chunks += ("No POI sequence information available\n", "normal")
+            
+            self.route_text.replace(1.0, "end", *chunks)
+        
+        except Exception as e:
+            log.warning("Error updating display: %s", e)
+    
     def handle_disconnect(self):
         self.connected = False
-        self.status_text.delete(1.0, "end")
-        self.status_text.insert("end", "Lost connection to SUMO\n")
+        self.update_status("Lost connection to SUMO")
         self.connect_button.config(text="Connect")
     
     def run(self):
         self.root.mainloop()
         self.running = False
-        self.update_thread.join()
+        self._wake_update_loop()
+        if self.update_thread:
+            self.update_thread.join()
         if self.sumo_process:
             self.sumo_process.terminate()
 
+    def _send_cmd(self, name, *parts):
+        """Queue one newline-terminated NAME[:part[:part...]] command for the update thread to send"""
+        if not self.connected:
+            raise ConnectionError("Not connected to SUMO")
+        buf = bytearray(name.encode())
+        for part in parts:
+            buf += b":"
+            buf += part.encode() if isinstance(part, str) else part
+        buf += b"\n"
+        # The socket is non-blocking for the update thread, so never write to it from here
+        with self._tx_lock:
+            self._txbuf += buf
+        self._wake_update_loop()
+    
     def change_agent_route(self, agent_id, new_poi_sequence, durations=None):
         """Change an agent's route to visit a new sequence of POIs"""
         try:
@@ -638,12 +917,22 @@ class TrajectoryViewer:
                 self.update_status("Not connected to SUMO")
                 return False
             
+            if not new_poi_sequence:
+                self.update_status("No POIs given for the new route")
+                return False
+            
+            # Skip resending the route this agent was last sent
+            key = (tuple(new_poi_sequence), tuple(durations or ()))
+            if self._last_sent_chain.get(agent_id) == key:
+                return True
+            
             # Send the command with both POI sequence and durations
-            command = f"CHANGE_ROUTE:{agent_id}:{','.join(new_poi_sequence)}"
+            parts = [agent_id.encode(), b",".join(poi.encode() for poi in new_poi_sequence)]
             if durations:
-                command += f":{','.join(str(d) for d in durations)}"
+                parts.append(b",".join(b"%d" % d for d in durations))
             
-            self.socket.send(command.encode())
+            self._send_cmd("CHANGE_ROUTE", *parts)
+            self._last_sent_chain[agent_id] = key
             return True
             
         except Exception as e:
@@ -653,161 +942,199 @@ class TrajectoryViewer:
     def submit_route_change(self):
         """Handle route change submission from the UI"""
         if not self.connected:
-            self.status_text.delete(1.0, "end")
-            self.status_text.insert("end", "Please connect to SUMO first\n")
+            self.update_status("Please connect to SUMO first")
             return
             
         if not self.tracked_agent:
-            self.status_text.delete(1.0, "end")
-            self.status_text.insert("end", "Please select an agent first\n")
+            self.update_status("Please select an agent first")
             return
             
         # Get POI sequence from entry
-        poi_sequence = [poi.strip() for poi in self.route_entry.get().split(",")]
+        poi_sequence = _parse_csv(self.route_entry.get())
         
         if not poi_sequence:
-            self.status_text.delete(1.0, "end")
-            self.status_text.insert("end", "Please enter POI names separated by commas\n")
+            self.update_status("Please enter POI names separated by commas")
             return
             
         # Send route change request
         try:
             self.change_agent_route(self.tracked_agent, poi_sequence)
-            self.status_text.delete(1.0, "end")
-            self.status_text.insert("end", "Route change request sent\n")
+            self.update_status("Route change request sent")
         except Exception as e:
-            self.status_text.delete(1.0, "end")
-            self.status_text.insert("end", f"Error changing route: {e}\n")
+            self.update_status(f"Error changing route: {e}")
 
     def modify_route_with_llm(self):
         """Handle route modification using LLM based on a prompt"""
         if not self.connected or not self.tracked_agent:
-            self.status_text.delete(1.0, "end")
-            self.status_text.insert("end", "Please connect to SUMO and select an agent\n")
+            self.update_status("Please connect to SUMO and select an agent")
             return
         
         prompt = self.llm_prompt_entry.get().strip()
         if not prompt:
-            self.status_text.delete(1.0, "end")
-            self.status_text.insert("end", "Please enter a situation prompt\n")
+            self.update_status("Please enter a situation prompt")
             return
         
         try:
             # Get vehicle data and traffic info
-            vehicle_data = self.last_vehicle_data.get('vehicle_data', {}).get(self.tracked_agent, {})
-            traffic_info = self.last_vehicle_data.get('traffic_info', {})
+            with self._vd_lock:
+                vehicle_data = self.last_vehicle_data.get('vehicle_data', {}).get(self.tracked_agent, {})
+                traffic_info = self.last_vehicle_data.get('traffic_info', {})
             
             if not vehicle_data or 'route_info' not in vehicle_data:
-                self.status_text.delete(1.0, "end")
-                self.status_text.insert("end", "Could not find vehicle data\n")
+                self.update_status("Could not find vehicle data")
                 return
             
             # Extract POI names from route info
-            current_chain = [poi['name'] for poi in vehicle_data['route_info'].get('poi_sequence', [])]
+            current_chain = list(map(itemgetter('name'), vehicle_data['route_info'].get('poi_sequence', ())))
             
             if not current_chain:
-                self.status_text.delete(1.0, "end")
-                self.status_text.insert("end", "Could not find current activity chain\n")
+                self.update_status("Could not find current activity chain")
+                return
+            
+            # A reply cached within LLM_CACHE_TTL is applied right away, without the worker thread
+            cached = self.activity_modifier.cached_chain(self.tracked_agent, current_chain, prompt,
+                                                         vehicle_data, traffic_info)
+            if cached is not None:
+                self._apply_llm_result(self.tracked_agent, *cached)
                 return
             
             # Update status
-            self.status_text.delete(1.0, "end")
-            self.status_text.insert("end", "Requesting route modification from LLM...\n")
+            self.update_status("Requesting route modification from LLM...")
             
-            def process_llm_request():
-                try:
-                    # Get selected agent
-                    selected_agent = self.agent_id_var.get()
-                    if not selected_agent:
-                        self.update_status("No agent selected")
-                        return
-                    
-                    # Get current chain from route info
-                    current_chain = []
-                    vehicle_data = {}
-                    if selected_agent in self.last_vehicle_data['vehicle_data']:
-                        vehicle_data = self.last_vehicle_data['vehicle_data'][selected_agent]
-                        if 'route_info' in vehicle_data and 'poi_sequence' in vehicle_data['route_info']:
-                            current_chain = [poi['name'] for poi in vehicle_data['route_info']['poi_sequence']]
-                    
-                    if not current_chain:
-                        self.update_status("No route information available for selected agent")
-                        return
-                    
-                    # Get prompt from text box
-                    prompt = self.llm_prompt_entry.get().strip()
-                    if not prompt:
-                        self.update_status("Please enter a prompt")
-                        return
-                    
-                    # Call LLM to modify chain
-                    prompt = "Go Ralphs instead of Trader Joe's"
-                    new_chain, durations = self.activity_modifier.modify_activity_chain_with_llm(
-                        selected_agent,
-                        current_chain,
-                        prompt,
-                        vehicle_data,
-                        self.last_vehicle_data.get('traffic_info', {})
-                    )
-                    
-                    if not new_chain:
-                        self.update_status("LLM did not return a valid chain")
-                        return
-                    
-                    # Display the new chain
-                    chain_str = ", ".join(new_chain)
-                    self.update_status(f"LLM suggested new route: {chain_str}")
-                    
-                    # Update the route entry field with the new chain
-                    self.route_entry.delete(0, tk.END)
-                    self.route_entry.insert(0, chain_str)
-                    
-                    # Ask user to confirm
-                    if tk.messagebox.askyesno("Confirm Route Change", 
-                                            f"Apply the suggested route?\n\n{chain_str}"):
-                        try:
-                            success = self.change_agent_route(selected_agent, new_chain, durations)
-                            if success:
-                                self.update_status("Route change request sent")
-                            else:
-                                self.update_status("Failed to change route")
-                        except Exception as e:
-                            self.update_status(f"Error changing route: {e}")
-                    else:
-                        self.update_status("Route change cancelled by user")
-                    
-                except Exception as e:
-                    self.update_status(f"Error processing LLM request: {e}")
-                    print(f"Error in process_llm_request: {e}")
-                    import traceback
-                    traceback.print_exc()
+            # Drop repeated clicks while the same request is still pending
+            key = (self.tracked_agent, prompt)
+            with self._llm_lock:
+                if key in self._llm_inflight:
+                    self.update_status("This LLM request is already in progress")
+                    return
+                self._llm_inflight.add(key)
             
-            threading.Thread(target=process_llm_request, daemon=True).start()
+            try:
+                # Everything the worker needs is captured here, on the Tk thread
+                snapshot = (self.tracked_agent, current_chain, prompt, vehicle_data, traffic_info)
+                self._llm_q.put_nowait(snapshot)
+            except queue.Full:
+                with self._llm_lock:
+                    self._llm_inflight.discard(key)
+                self.update_status("Too many pending LLM requests, please wait")
             
         except Exception as e:
-            self.status_text.delete(1.0, "end")
-            self.status_text.insert("end", f"Error preparing LLM request: {e}\n")
+            self.update_status(f"Error preparing LLM request: {e}")
+    
+    def _llm_worker(self):
+        """Serve queued LLM route requests one at a time"""
+        while True:
+            snapshot = self._llm_q.get()
+            try:
+                self.process_llm_request(snapshot)
+            finally:
+                with self._llm_lock:
+                    self._llm_inflight.discard((snapshot[0], snapshot[2]))
+                self._llm_q.task_done()
+    
+    def process_llm_request(self, snapshot):
+        """Ask the LLM for a new activity chain; runs on the LLM worker thread"""
+        selected_agent, current_chain, prompt, vehicle_data, traffic_info = snapshot
+        try:
+            # Each request is its own batch
+            self.activity_modifier.clear_agent_context_cache()
+            
+            # Call LLM to modify chain
+            new_chain, durations = self.activity_modifier.modify_activity_chain_with_llm(
+                selected_agent,
+                current_chain,
+                prompt,
+                vehicle_data,
+                traffic_info
+            )
+            
+            if not new_chain:
+                self.root.after(0, self.update_status, "LLM did not return a valid chain")
+                return
+            
+            self.root.after(0, self._apply_llm_result, selected_agent, new_chain, durations)
+            
+        except Exception as e:
+            self.root.after(0, self.update_status, f"Error processing LLM request: {e}")
+            log.warning("Error in process_llm_request: %s", e)
+            if DEBUG:
+                traceback.print_exc()
+    
+    def _apply_llm_result(self, selected_agent, new_chain, durations):
+        """Show the suggested chain and ask whether to apply it; runs on the Tk thread"""
+        # Display the new chain
+        chain_str = ", ".join(new_chain)
+        self.update_status(f"LLM suggested new route: {chain_str}")
+        
+        # Update the route entry field with the new chain
+        self.route_entry.delete(0, tk.END)
+        self.route_entry.insert(0, chain_str)
+        
+        # Ask user to confirm without blocking the event loop
+        self._show_confirm(selected_agent, new_chain, durations, chain_str)
+    
+    def _show_confirm(self, selected_agent, new_chain, durations, chain_str):
+        """Non-modal Yes/No window for applying an LLM suggested route"""
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Confirm Route Change")
+        dialog.transient(self.root)
+        
+        ttk.Label(dialog, text=f"Apply the suggested route for agent {selected_agent}?\n\n{chain_str}",
+                  wraplength=400, padding="10").pack(fill="x")
+        
+        def answer(accepted):
+            dialog.destroy()
+            if not accepted:
+                self.update_status("Route change cancelled by user")
+                return
+            try:
+                success = self.change_agent_route(selected_agent, new_chain, durations)
+                if success:
+                    self.update_status("Route change request sent")
+                else:
+                    self.update_status("Failed to change route")
+            except Exception as e:
+                self.update_status(f"Error changing route: {e}")
+        
+        button_frame = ttk.Frame(dialog, padding="5")
+        button_frame.pack()
+        ttk.Button(button_frame, text="Yes", command=lambda: answer(True)).pack(side="left", padx=5)
+        ttk.Button(button_frame, text="No", command=lambda: answer(False)).pack(side="left", padx=5)
+        dialog.protocol("WM_DELETE_WINDOW", lambda: answer(False))
     
     def update_status(self, message):
-        """Update the status text widget"""
-        self.status_text.delete(1.0, "end")
-        self.status_text.insert("end", message + "\n")
+        """Queue a status message; repeats of a message already pending are dropped"""
+        with self._status_lock:
+            self._pending_status[message] = None
+            if self._status_scheduled:
+                return
+            self._status_scheduled = True
+        self.root.tk.call('after', 'idle', self._flush_cb)
+    
+    def _flush_status(self):
+        """Write the pending status messages to the status text widget"""
+        with self._status_lock:
+            messages = self._pending_status
+            self._pending_status = {}
+            self._status_scheduled = False
+        if messages:
+            self._set_status("\n".join(messages))
+    
+    def _set_status(self, message):
+        """Replace the status text in one Tk call; only _flush_status calls this, on the Tk thread"""
+        self.status_text.replace(1.0, "end", message + "\n")
 
     def update_demographics(self, demo):
-        self.demographics_text.delete(1.0, "end")
-        self.demographics_text.insert("end", "Demographics:\n", "title")
-        self.demographics_text.insert("end", "Age: ", "label")
-        self.demographics_text.insert("end", f"{demo['age']}\n", "value")
-        self.demographics_text.insert("end", "Gender: ", "label")
-        self.demographics_text.insert("end", f"{demo['gender']}\n", "value")
-        self.demographics_text.insert("end", "Student: ", "label")
-        self.demographics_text.insert("end", f"{demo['student_status']}\n", "value")
-        self.demographics_text.insert("end", "Income: ", "label")
-        self.demographics_text.insert("end", f"{demo['income_level']}\n", "value")
-        self.demographics_text.insert("end", "Education: ", "label")
-        self.demographics_text.insert("end", f"{demo['education_level']}\n", "value")
-        self.demographics_text.insert("end", "Work: ", "label")
-        self.demographics_text.insert("end", f"{demo['work_status']}\n", "value")
+        self.demographics_text.replace(
+            1.0, "end",
+            "Demographics:\n", "title",
+            "Age: ", "label", f"{demo['age']}\n", "value",
+            "Gender: ", "label", f"{demo['gender']}\n", "value",
+            "Student: ", "label", f"{demo['student_status']}\n", "value",
+            "Income: ", "label", f"{demo['income_level']}\n", "value",
+            "Education: ", "label", f"{demo['education_level']}\n", "value",
+            "Work: ", "label", f"{demo['work_status']}\n", "value",
+        )
 
     def close_roads(self):
         """Handle road closure request"""
@@ -815,14 +1142,13 @@ class TrajectoryViewer:
             self.update_status("Please connect to SUMO first")
             return
         
-        edge_ids = [edge.strip() for edge in self.closure_entry.get().split(",")]
+        edge_ids = _parse_csv(self.closure_entry.get())
         if not edge_ids:
             self.update_status("Please enter edge IDs separated by commas")
             return
         
         try:
-            command = f"CLOSE_ROADS:{','.join(edge_ids)}"
-            self.socket.sendall(command.encode())
+            self._send_cmd("CLOSE_ROADS", ','.join(edge_ids))
             self.update_status("Road closure request sent")
             self.closure_entry.delete(0, tk.END)
         except Exception as e:
@@ -831,37 +1157,29 @@ class TrajectoryViewer:
     def reopen_roads(self, reopen_all=False):
         """Handle road reopening request"""
         if not self.connected:
-            self.status_text.delete(1.0, "end")
-            self.status_text.insert("end", "Please connect to SUMO first\n")
+            self.update_status("Please connect to SUMO first")
             return
         
         try:
             if reopen_all:
-                command = "REOPEN_ALL_ROADS"
+                self._send_cmd("REOPEN_ALL_ROADS")
             else:
                 # Get edge IDs from entry
-                edge_ids = [edge.strip() for edge in self.closure_entry.get().split(",")]
+                edge_ids = _parse_csv(self.closure_entry.get())
                 if not edge_ids:
-                    self.status_text.delete(1.0, "end")
-                    self.status_text.insert("end", "Please enter edge IDs separated by commas\n")
+                    self.update_status("Please enter edge IDs separated by commas")
                     return
-                command = f"REOPEN_ROADS:{','.join(edge_ids)}"
-            
-            # Use sendall and add delay
-            self.socket.sendall(command.encode())
-            time.sleep(0.1)
+                self._send_cmd("REOPEN_ROADS", ','.join(edge_ids))
             
-            self.status_text.delete(1.0, "end")
-            self.status_text.insert("end", "Road reopening request sent\n")
+            self.update_status("Road reopening request sent")
             
             # Clear the entry field after successful command
             if not reopen_all:
                 self.closure_entry.delete(0, tk.END)
             
         except Exception as e:
-            print(f"Error sending reopen command: {e}")
-            self.status_text.delete(1.0, "end")
-            self.status_text.insert("end", f"Error reopening roads: {e}\n")
+            log.warning("Error sending reopen command: %s", e)
+            self.update_status(f"Error reopening roads: {e}")
 
     def handle_event_creation(self):
         """Handle the creation of a new event"""
@@ -872,7 +1190,7 @@ class TrajectoryViewer:
         try:
             # Validate inputs
             event_type = self.event_type_var.get()
-            print(f"Creating {event_type} event...")
+            log.info("Creating %s event...", event_type)
             if not event_type:
                 self.update_status("Please select an event type")
                 return
@@ -886,7 +1204,7 @@ class TrajectoryViewer:
             try:
                 lat, lon = self.event_handler.get_poi_coordinates(poi_name)
                 capacity = int(self.capacity_entry.get())
-                print(f"Event parameters - Location: {poi_name}, Capacity: {capacity}")
+                log.info("Event parameters - Location: %s, Capacity: %s", poi_name, capacity)
             except ValueError:
                 self.update_status("Please enter a valid number for capacity")
                 return
@@ -909,20 +1227,19 @@ class TrajectoryViewer:
                 event_data['name'] = event_name
             
             # Send event creation command to dynamic_control
-            # First send the command identifier
-            command = f"CREATE_EVENT:{json.dumps(event_data)}\n"
-            self.socket.sendall(command.encode())
-            print("Event creation request sent")
+            self._send_cmd("CREATE_EVENT", json_codec.dumps(event_data))
+            log.info("Event creation request sent")
             self.update_status("Processing event...")
 
         except Exception as e:
-            print(f"Error in event creation: {e}")
+            log.warning("Error in event creation: %s", e)
             self.update_status(f"Error creating event: {e}")
 
 def main():
+    logging.basicConfig(level=logging.DEBUG if DEBUG else logging.INFO, format="%(message)s")
     root = tk.Tk()
     viewer = TrajectoryViewer(root)
-    root.mainloop()
+    viewer.run()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# Modules are imported the way the scripts run them: utilities as a package
+# from the project root, and the runs/ scripts by their module name
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (PROJECT_DIR, os.path.join(PROJECT_DIR, "runs")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
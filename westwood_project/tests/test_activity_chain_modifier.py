@@ -0,0 +1,81 @@
+import pytest
+
+from utilities.activity_chain_modifier import (ActivityChainModifier, _seconds_to_quarters,
+                                               _seconds_to_time_str)
+
+
+def _baseline_parse(response, current_chain, poi_names):
+    """The original split-based parser, kept as the reference behaviour"""
+    valid_chain = []
+    durations = []
+    for item in (item.strip() for item in response.split(',')):
+        try:
+            poi_name, quarters = item.split(':')
+            poi_name = poi_name.strip()
+            quarters = int(quarters.strip())
+            if poi_name in poi_names or poi_name in current_chain:
+                valid_chain.append(poi_name)
+                durations.append(quarters * 900)
+        except ValueError:
+            pass
+    if not valid_chain:
+        return current_chain, []
+    return valid_chain, durations
+
+
+@pytest.fixture
+def modifier():
+    # Only the POI lookup is needed for parsing; skip loading POI files and the API setup
+    modifier = ActivityChainModifier.__new__(ActivityChainModifier)
+    modifier._poi_by_name = {"Home": {}, "Ackerman Union": {}, "Pauley Pavilion": {}}
+    return modifier
+
+
+def test_parse_llm_response(modifier):
+    chain, durations = modifier._parse_llm_response(
+        "Home:4, Ackerman Union : 8,Pauley Pavilion:2", ["Home"])
+    assert chain == ["Home", "Ackerman Union", "Pauley Pavilion"]
+    assert durations == [3600, 7200, 1800]
+
+
+def test_parse_llm_response_skips_invalid_items(modifier):
+    chain, durations = modifier._parse_llm_response(
+        "Home:4, Unknown Place:2, Ackerman Union, Pauley Pavilion:two, Work:3", ["Work"])
+    assert chain == ["Home", "Work"]
+    assert durations == [3600, 2700]
+
+
+def test_parse_llm_response_keeps_original_chain(modifier):
+    assert modifier._parse_llm_response("I cannot help with that.", ["Home", "Work"]) == (["Home", "Work"], [])
+    assert modifier._parse_llm_response("", ["Home"]) == (["Home"], [])
+
+
+@pytest.mark.parametrize("response", [
+    "Home:4, Ackerman Union:8",
+    " Home : 4 ,Ackerman Union:8 ",
+    "Home:4,,Ackerman Union:8,",
+    "Home:4:5, Ackerman Union:8",
+    "Home:-4, Ackerman Union:8",
+    "Home:+4, Ackerman Union:8",
+    "Home:4.5, Ackerman Union:8",
+    "Home, Ackerman Union:",
+    ":4, Home:1",
+    "Work:2, Nowhere:3",
+])
+def test_parse_llm_response_matches_baseline(modifier, response):
+    current_chain = ["Home", "Work"]
+    expected = _baseline_parse(response, current_chain, modifier._poi_by_name)
+    assert modifier._parse_llm_response(response, current_chain) == expected
+
+
+@pytest.mark.parametrize("seconds", [0, 59, 60, 899, 900, 901, 3599, 3600, 43200, 86399, 86400,
+                                     86460, 90000, 172800 + 1234])
+def test_seconds_conversions_match_baseline(seconds):
+    assert _seconds_to_quarters(seconds) == (seconds // 60) // 15
+    assert _seconds_to_time_str(seconds) == f"{seconds // 3600:02d}:{(seconds % 3600) // 60:02d}"
+
+
+def test_seconds_to_time_str_whole_day():
+    for seconds in range(0, 86400 + 1, 60):
+        assert _seconds_to_time_str(seconds) == f"{seconds // 3600:02d}:{(seconds % 3600) // 60:02d}"
+    assert _seconds_to_time_str(86400) == "24:00"
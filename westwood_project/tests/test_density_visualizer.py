@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from utilities.density_visualizer import DensityVisualizer
+
+
+def _baseline_density(cells, grid_size):
+    """The original per-vehicle Gaussian spread, kept as the reference behaviour"""
+    density_grid = np.zeros((grid_size, grid_size))
+    sigma = 2.0
+    for grid_x, grid_y in cells:
+        x_range = np.arange(max(0, grid_x-4), min(grid_size, grid_x+5))
+        y_range = np.arange(max(0, grid_y-4), min(grid_size, grid_y+5))
+        X, Y = np.meshgrid(x_range, y_range)
+        gaussian = np.exp(-((X-grid_x)**2 + (Y-grid_y)**2)/(2*sigma**2))
+        x_indices = slice(max(0, grid_x-4), min(grid_size, grid_x+5))
+        y_indices = slice(max(0, grid_y-4), min(grid_size, grid_y+5))
+        density_grid[y_indices, x_indices] += gaussian
+    return density_grid
+
+
+@pytest.mark.parametrize("grid_size", [10, 100])
+def test_blur_matches_per_vehicle_spread(grid_size):
+    visualizer = DensityVisualizer.__new__(DensityVisualizer)
+    visualizer.grid_size = grid_size
+    blur = visualizer._blur_matrix()
+    
+    rng = np.random.default_rng(0)
+    cells = rng.integers(0, grid_size, size=(500, 2))
+    # Corners exercise the truncation at the grid border
+    cells = np.vstack([cells, [[0, 0], [grid_size - 1, grid_size - 1], [0, grid_size - 1]]])
+    counts = np.bincount(cells[:, 1] * grid_size + cells[:, 0], minlength=grid_size * grid_size)
+    counts = counts.reshape(grid_size, grid_size).astype(np.float32)
+    
+    expected = _baseline_density(cells.tolist(), grid_size)
+    np.testing.assert_allclose(blur @ counts @ blur, expected, rtol=1e-5, atol=1e-4)
@@ -0,0 +1,96 @@
+import struct
+
+import pytest
+
+from dynamic_control import split_commands
+from trajectory_viewer import FRAME_END, take_latest_frame
+from utilities.density_visualizer import FRAME_START, parse_frame_header
+
+
+def test_split_commands_keeps_partial_command():
+    buf = bytearray(b"TRACK_AGENT:1\nCLOSE_RO")
+    assert split_commands(buf) == ["TRACK_AGENT:1"]
+    assert buf == b"CLOSE_RO"
+    
+    buf += b"AD:a,b\r\nGET_ALL_VEHICLES\n"
+    assert split_commands(buf) == ["CLOSE_ROAD:a,b", "GET_ALL_VEHICLES"]
+    assert buf == b""
+
+
+def test_split_commands_without_newline():
+    buf = bytearray(b"TRACK")
+    assert split_commands(buf) == []
+    assert buf == b"TRACK"
+
+
+def test_split_commands_multibyte_character_split_across_reads():
+    encoded = "EVENT:café\n".encode("utf-8")
+    buf = bytearray(encoded[:9])
+    assert split_commands(buf) == []
+    buf += encoded[9:]
+    assert split_commands(buf) == ["EVENT:café"]
+
+
+def test_take_latest_frame_returns_newest_complete_message():
+    buf = bytearray(b'{"a": 1}' + FRAME_END + b'{"a": 2}' + FRAME_END + b'{"a": 3')
+    message, offset = take_latest_frame(buf)
+    assert message == b'{"a": 2}'
+    assert buf == b'{"a": 3'
+    assert offset == max(0, len(buf) - len(FRAME_END) + 1)
+
+
+def test_take_latest_frame_incomplete():
+    buf = bytearray(b'{"a": 1}')
+    message, offset = take_latest_frame(buf)
+    assert message is None
+    assert buf == b'{"a": 1}'
+    assert offset == len(buf) - len(FRAME_END) + 1
+
+
+@pytest.mark.parametrize("split", range(1, len(FRAME_END)))
+def test_take_latest_frame_terminator_split_across_reads(split):
+    frame = b'{"a": 1}' + FRAME_END
+    cut = len(frame) - len(FRAME_END) + split
+    buf = bytearray(frame[:cut])
+    message, offset = take_latest_frame(buf)
+    assert message is None
+    
+    buf += frame[cut:]
+    message, offset = take_latest_frame(buf, offset)
+    assert message == b'{"a": 1}'
+    assert buf == b""
+    assert offset == 0
+
+
+def test_take_latest_frame_empty_message():
+    buf = bytearray(FRAME_END)
+    message, _ = take_latest_frame(buf)
+    assert message == b""
+
+
+def test_parse_frame_header_after_periodic_frames():
+    payload = b'{"vehicles": {}}'
+    data = b'{"x": 1}' + FRAME_END + FRAME_START + struct.pack(">I", len(payload)) + payload
+    start_idx, size = parse_frame_header(bytearray(data))
+    assert start_idx == data.index(FRAME_START)
+    assert size == len(payload)
+
+
+def test_parse_frame_header_byte_by_byte():
+    payload = b"x" * 70000
+    data = b"noise" + FRAME_START + struct.pack(">I", len(payload)) + payload
+    header_end = data.index(FRAME_START) + len(FRAME_START) + 4
+    buf = bytearray()
+    start_idx, size = -1, None
+    for i in range(header_end):
+        old_len = len(buf)
+        buf += data[i:i + 1]
+        start_idx, size = parse_frame_header(buf, start_idx, old_len)
+        if i < header_end - 1:
+            assert size is None
+    assert start_idx == data.index(FRAME_START)
+    assert size == len(payload)
+
+
+def test_parse_frame_header_without_marker():
+    assert parse_frame_header(bytearray(b'{"x": 1}' + FRAME_END)) == (-1, None)
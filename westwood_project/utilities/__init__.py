@@ -9,12 +9,17 @@ This package contains utility classes and functions for:
 - Prompt management for AI interactions
 """
 
+import logging
+
+# Log records go nowhere unless the application configures logging; levels are left to it
+logging.getLogger(__name__).addHandler(logging.NullHandler())
+
 from .activity_chain_modifier import ActivityChainModifier
 from .road_closure_handler import RoadClosureHandler
 from .event_handler import EventHandler
 from .prompt_manager import PromptManager
 from .density_visualizer import DensityVisualizer
-from .update_destination import update_agent_destination, get_available_destinations
+from .update_destination import update_agent_destination, update_agent_destinations, get_available_destinations, load_destination_updates
 from .filter_polygons import filter_polygons
 
 __all__ = [
@@ -27,6 +32,8 @@ __all__ = [
     
     # Utility functions
     'update_agent_destination',
+    'update_agent_destinations',
     'get_available_destinations',
+    'load_destination_updates',
     'filter_polygons',
 ] 
\ No newline at end of file
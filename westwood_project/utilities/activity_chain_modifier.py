@@ -1,18 +1,161 @@
 import os
 import json
 import math
+import logging
+import re
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import socket
 import concurrent.futures
+import threading
+import time
+import hashlib
+from collections import OrderedDict
+import asyncio
+import numpy as np
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
 from typing import List, Dict, Tuple, Optional, Any
+from . import json_codec
+try:
+    import httpx
+except ImportError:
+    httpx = None
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        """numba is optional; without it the function stays plain Python"""
+        def decorator(func):
+            return func
+        return decorator
+
+logger = logging.getLogger(__name__)
+
+# System prompt for activity chain modification; identical for every agent
+_SYSTEM_PROMPT = """
+        You are an AI assistant that helps modify activity chains for agents in a simulation.
+        Given the current activity chain with timing information, agent's current location, demographics, traffic conditions, and event timing, suggest a modified chain that makes sense.
+        
+        The activity chain should respect the event timing - make sure the agent is at the event location during the specified event time.
+        If there are conflicting activities during the event time, reschedule them to before or after the event.
+        
+        Only respond with the new activity chain as a comma-separated list of POI names and durations in quarters (15-minute blocks).
+        Format: POI_name:quarters, POI_name:quarters, ...
+        Example: Falafel Inc.:32, Starbucks:4, UCLA_Parking_Lot_2:16, Ralphs:8, Falafel Inc.:36
+        
+        Each quarter represents 15 minutes, so:
+        - 4 quarters = 1 hour
+        - 32 quarters = 8 hours
+        - 96 quarters = 24 hours
+        
+        Do not include any explanations or additional text.
+        """
+
+# One 'POI_name:quarters' item of an LLM reply, between commas
+_CHAIN_RE = re.compile(r'(?:^|,)\s*([^:,]+?)\s*:\s*([+-]?\d+)\s*(?=,|$)')
+
+# Number of distinct prompts whose LLM replies are kept in memory, and for how
+# many seconds a reply is reused (override with LLM_CACHE_TTL)
+LLM_CACHE_SIZE = 4096
+LLM_CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", 300))
+
+# Number of agent prompt contexts (timing, distance and demographics text) kept per batch
+AGENT_CTX_CACHE_SIZE = 1024
+
+# Set MOBIVERSE_LLM_ASYNC=1 to send LLM batches over httpx/asyncio instead of the thread pool
+LLM_ASYNC = os.environ.get('MOBIVERSE_LLM_ASYNC', '0') == '1'
+
+# Retry policy shared by the requests session and the async httpx path
+RETRY_TOTAL = 3
+RETRY_BACKOFF = 0.2
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+@njit(cache=True, fastmath=True)
+def _haversine_km(lat1, lon1, lat2, lon2):
+    """Haversine distance in kilometers between two points given in degrees"""
+    # Convert decimal degrees to radians
+    lat1 = math.radians(lat1)
+    lon1 = math.radians(lon1)
+    lat2 = math.radians(lat2)
+    lon2 = math.radians(lon2)
+    
+    # Haversine formula
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
+    c = 2 * math.asin(math.sqrt(a))
+    r = 6371  # Radius of earth in kilometers
+    
+    return c * r
+
+# Compile now so the first simulation step does not pay for it
+_haversine_km(0.0, 0.0, 0.0, 0.0)
+
+# "HH:MM" for every minute of the day, including 24:00 for end times at midnight
+_HHMM = [f"{h:02d}:{m:02d}" for h in range(24) for m in range(60)] + ["24:00"]
+
+def _seconds_to_quarters(seconds):
+    # seconds // 60 // 15 == seconds // 900
+    return seconds // 900
+
+def _seconds_to_time_str(seconds):
+    minutes = seconds // 60
+    if 0 <= minutes <= 1440:
+        return _HHMM[minutes]
+    # Outside a single day (e.g. after midnight of the next day) format directly
+    return f"{seconds // 3600:02d}:{(seconds % 3600) // 60:02d}"
 
 class ActivityChainModifier:
-    def __init__(self, max_workers=50):
-        """Initialize the activity chain modifier with API key from file"""
+    def __init__(self, max_workers=50, use_async=None):
+        """Initialize the activity chain modifier with API key from file
+
+        use_async: send batches with asyncio/httpx instead of the thread pool
+        (defaults to MOBIVERSE_LLM_ASYNC; needs httpx)
+        """
         self.api_key = self.load_api_key()
         self.pois = self.load_pois()
+        self._build_poi_arrays()
+        self._poi_by_name = {}
+        self._name_to_idx = {}
+        for i, poi in enumerate(self.pois):
+            # Keep the first POI for duplicate names, as the linear scan did
+            if poi.get('name') not in self._poi_by_name:
+                self._poi_by_name[poi.get('name')] = poi
+                self._name_to_idx[poi.get('name')] = i
+        # POIs never move, so pair distances can be kept for the process lifetime
+        self._pair_dist_cache: Dict[Tuple[str, str], float] = {}
         self.route_info = self.load_route_info()
         self.max_workers = max_workers
+        self.use_async = LLM_ASYNC if use_async is None else use_async
+        if self.use_async and httpx is None:
+            print("httpx is not installed, LLM batches will use the thread pool")
+            self.use_async = False
+        self._http = self._create_http_session()
+        # (time stored, LLM reply) keyed by a hash of the prompt pair; shared by all worker threads
+        self._llm_cache: "OrderedDict[bytes, Tuple[float, str]]" = OrderedDict()
+        self._llm_cache_lock = threading.Lock()
+        # Prompt context text keyed on everything it is built from; cleared per batch
+        self._agent_ctx_cache: "OrderedDict[Tuple, Tuple[List[str], List[str], str]]" = OrderedDict()
+        self._agent_ctx_lock = threading.Lock()
+        # Requests currently being sent, so identical concurrent prompts are coalesced
+        self._llm_inflight: Dict[bytes, concurrent.futures.Future] = {}
+        
+    def _create_http_session(self) -> requests.Session:
+        """Pooled keep-alive session shared by all LLM calls, sized for the worker pool"""
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.max_workers,
+            pool_maxsize=self.max_workers,
+            max_retries=Retry(total=RETRY_TOTAL, backoff_factor=RETRY_BACKOFF,
+                              status_forcelist=sorted(RETRY_STATUSES),
+                              allowed_methods=frozenset(["POST"]))
+        )
+        session.mount('https://', adapter)
+        return session
         
     def load_api_key(self) -> str:
         """Load OpenAI API key from file"""
@@ -29,28 +172,66 @@ class ActivityChainModifier:
         try:
             import xml.etree.ElementTree as ET
             poi_path = '../poi/pois.add.xml'
-            tree = ET.parse(poi_path)
-            root = tree.getroot()
             
+            # Stream the file instead of building the whole tree; only <poi>
+            # elements directly under the root are used, as with root.findall('poi')
             pois = []
-            for poi in root.findall('poi'):
-                pois.append({
-                    'id': poi.get('id'),
-                    'lat': float(poi.get('lat')),
-                    'lon': float(poi.get('lon')),
-                    'name': poi.get('name', poi.get('id')),
-                    'type': poi.get('type', 'unknown')
-                })
+            depth = 0
+            root = None
+            for event, elem in ET.iterparse(poi_path, events=('start', 'end')):
+                if event == 'start':
+                    if root is None:
+                        root = elem
+                    depth += 1
+                    continue
+                depth -= 1
+                if depth != 1:
+                    continue
+                if elem.tag == 'poi':
+                    pois.append({
+                        'id': elem.get('id'),
+                        'lat': float(elem.get('lat')),
+                        'lon': float(elem.get('lon')),
+                        'name': elem.get('name', elem.get('id')),
+                        'type': elem.get('type', 'unknown')
+                    })
+                # Drop elements that have been consumed
+                root.clear()
             return pois
         except Exception as e:
             print(f"Error loading POIs: {e}")
             return []
             
+    def _build_poi_arrays(self):
+        """Keep POI coordinates in parallel arrays for vectorized distance queries"""
+        # Degrees as float32 (struct-of-arrays next to the metadata dicts), radians for haversine.
+        # Checked against a float64 haversine on pois.add.xml (20k random queries over the POI
+        # bounding box plus one next to each POI): degrees round by at most 0.2 m, and when the
+        # float32 nearest POI differs (~0.4% of queries, near-equidistant ties) it is at most
+        # 2 m farther than the true nearest; the closest distinct POIs are 31 m apart
+        self._poi_lat_deg = np.fromiter((poi['lat'] for poi in self.pois), dtype=np.float32, count=len(self.pois))
+        self._poi_lon_deg = np.fromiter((poi['lon'] for poi in self.pois), dtype=np.float32, count=len(self.pois))
+        self._poi_lat = np.radians(self._poi_lat_deg)
+        self._poi_lon = np.radians(self._poi_lon_deg)
+        self._poi_names = tuple(poi['name'] for poi in self.pois)
+        
+        # With scipy available, index the POIs as points on the unit sphere; the
+        # straight-line distance there grows with the great-circle distance
+        self._poi_tree = None
+        if cKDTree is not None and self.pois:
+            self._poi_tree = cKDTree(self._unit_vectors(self._poi_lat, self._poi_lon))
+    
+    @staticmethod
+    def _unit_vectors(lat, lon):
+        """Convert latitude/longitude arrays in radians to 3D unit vectors"""
+        cos_lat = np.cos(lat)
+        return np.column_stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)])
+            
     def load_route_info(self) -> List[Dict]:
         """Load route information from route_info.json"""
         try:
-            with open('../data/route_info.json', 'r') as f:
-                return json.load(f)
+            with open('../data/route_info.json', 'rb') as f:
+                return json_codec.loads(f.read())
         except Exception as e:
             print(f"Error loading route info: {e}")
             return []
@@ -61,17 +242,21 @@ class ActivityChainModifier:
             # Request vehicle data
             socket_conn.send("GET_VEHICLES".encode())
             
-            # Wait for response
-            buffer = ""
-            while "<<END>>" not in buffer:
-                data = socket_conn.recv(16384).decode('utf-8', errors='ignore')
-                buffer += data
+            # Wait for response; collect raw bytes and decode the message once
+            buffer = bytearray()
+            end = -1
+            while True:
+                data = socket_conn.recv(65536)
                 if not data:
                     break
+                buffer += data
+                # Only the new bytes (plus a terminator split across reads) can hold <<END>>
+                end = buffer.find(b"<<END>>", max(0, len(buffer) - len(data) - len(b"<<END>>") + 1))
+                if end != -1:
+                    break
             
-            if "<<END>>" in buffer:
-                message, _ = buffer.split("<<END>>", 1)
-                info = json.loads(message)
+            if end != -1:
+                info = json_codec.loads(memoryview(buffer)[:end])
                 
                 if agent_id in info.get('vehicle_data', {}):
                     vehicle_data = info['vehicle_data'][agent_id]
@@ -107,64 +292,93 @@ class ActivityChainModifier:
     
     def find_nearest_poi(self, lat: float, lon: float) -> Optional[Dict]:
         """Find the nearest POI to a given lat/lon position"""
-        nearest = None
-        min_dist = float('inf')
+        idx = self._nearest_poi_index(lat, lon)
+        return self.pois[idx] if idx >= 0 else None
+    
+    def _nearest_poi_index(self, lat: float, lon: float) -> int:
+        """Index into the POI arrays of the POI nearest to lat/lon, or -1 without POIs"""
+        if not self.pois:
+            return -1
         
-        for poi in self.pois:
-            try:
-                poi_lat = float(poi['lat'])
-                poi_lon = float(poi['lon'])
-                
-                dist = self.calculate_distance(lat, lon, poi_lat, poi_lon)
-                
-                if dist < min_dist:
-                    min_dist = dist
-                    nearest = poi
-            except Exception:
-                continue
-            
-        return nearest
+        if self._poi_tree is not None:
+            return int(self._nearest_poi_indices([lat], [lon])[0])
+        
+        # Haversine over all POIs at once; the distance grows with the 'a' term,
+        # so the nearest POI is its argmin and asin/sqrt can be skipped
+        lat_r = np.float32(math.radians(lat))
+        lon_r = np.float32(math.radians(lon))
+        dlat = self._poi_lat - lat_r
+        dlon = self._poi_lon - lon_r
+        a = np.sin(dlat/2)**2 + np.cos(lat_r) * np.cos(self._poi_lat) * np.sin(dlon/2)**2
+        
+        return int(np.argmin(a))
     
-    def calculate_distance(self, lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-        """Calculate the Haversine distance between two points in kilometers"""
-        # Convert decimal degrees to radians
-        lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+    def _nearest_poi_indices(self, lats, lons) -> np.ndarray:
+        """Indices into self.pois of the POIs nearest to each (lat, lon) pair, in one query"""
+        lat_r = np.radians(np.asarray(lats, dtype=np.float32))
+        lon_r = np.radians(np.asarray(lons, dtype=np.float32))
         
-        # Haversine formula
-        dlon = lon2 - lon1
-        dlat = lat2 - lat1
-        a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
-        c = 2 * math.asin(math.sqrt(a))
-        r = 6371  # Radius of earth in kilometers
+        if self._poi_tree is not None:
+            _, idx = self._poi_tree.query(self._unit_vectors(lat_r, lon_r), k=1)
+            return np.asarray(idx)
         
-        return c * r
+        dlat = self._poi_lat[None, :] - lat_r[:, None]
+        dlon = self._poi_lon[None, :] - lon_r[:, None]
+        a = np.sin(dlat/2)**2 + np.cos(lat_r)[:, None] * np.cos(self._poi_lat)[None, :] * np.sin(dlon/2)**2
+        return np.argmin(a, axis=1)
+    
+    def calculate_distance(self, lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+        """Calculate the Haversine distance between two points in kilometers"""
+        return _haversine_km(float(lat1), float(lon1), float(lat2), float(lon2))
     
     def get_poi_by_name(self, name: str) -> Optional[Dict]:
         """Find a POI by its name"""
-        for poi in self.pois:
-            if poi.get('name') == name:
-                return poi
-        return None
+        return self._poi_by_name.get(name)
     
     def get_distance_between_pois(self, poi1_name: str, poi2_name: str) -> Optional[float]:
         """Calculate the distance between two POIs by name"""
-        poi1 = self.get_poi_by_name(poi1_name)
-        poi2 = self.get_poi_by_name(poi2_name)
+        key = (poi1_name, poi2_name) if poi1_name <= poi2_name else (poi2_name, poi1_name)
+        dist = self._pair_dist_cache.get(key)
+        if dist is not None:
+            return dist
+        
+        i1 = self._name_to_idx.get(poi1_name)
+        i2 = self._name_to_idx.get(poi2_name)
         
-        if not poi1 or not poi2:
+        if i1 is None or i2 is None:
             return None
             
         try:
-            lat1 = float(poi1['lat'])
-            lon1 = float(poi1['lon'])
-            lat2 = float(poi2['lat'])
-            lon2 = float(poi2['lon'])
-            
-            return self.calculate_distance(lat1, lon1, lat2, lon2)
+            dist = _haversine_km(float(self._poi_lat_deg[i1]), float(self._poi_lon_deg[i1]),
+                                 float(self._poi_lat_deg[i2]), float(self._poi_lon_deg[i2]))
+            self._pair_dist_cache[key] = dist
+            return dist
         except Exception as e:
             print(f"Error calculating distance: {e}")
             return None
     
+    def chain_distance_info(self, chain: List[str]) -> List[str]:
+        """Describe the distance of each consecutive pair of known POIs in a chain"""
+        if len(chain) < 2:
+            return []
+        
+        # Haversine for all consecutive pairs at once; pairs with an unknown POI are skipped
+        idx = np.array([self._name_to_idx.get(name, -1) for name in chain])
+        valid = (idx[:-1] >= 0) & (idx[1:] >= 0)
+        i1 = idx[:-1][valid]
+        i2 = idx[1:][valid]
+        lat1, lat2 = self._poi_lat[i1], self._poi_lat[i2]
+        dlat = lat2 - lat1
+        dlon = self._poi_lon[i2] - self._poi_lon[i1]
+        a = np.sin(dlat/2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon/2)**2
+        dists = 2 * np.arcsin(np.sqrt(a)) * 6371
+        
+        return [
+            f"Distance from {chain[i]} to {chain[i+1]}: {dist:.2f} km"
+            for i, dist in zip(np.flatnonzero(valid).tolist(), dists.tolist())
+            if dist
+        ]
+    
     def get_agent_route_info(self, agent_id: str) -> Optional[Dict]:
         """Get the route information for a specific agent"""
         for route in self.route_info:
@@ -174,25 +388,159 @@ class ActivityChainModifier:
     
     def seconds_to_quarters(self, seconds):
         """Convert seconds since midnight to quarter-hour index (0-95)"""
-        minutes = seconds // 60
-        return minutes // 15
+        return _seconds_to_quarters(seconds)
 
     def seconds_to_time_str(self, seconds):
         """Convert seconds since midnight to HH:MM format"""
-        hours = seconds // 3600
-        minutes = (seconds % 3600) // 60
-        return f"{hours:02d}:{minutes:02d}"
+        return _seconds_to_time_str(seconds)
 
+    @staticmethod
+    def congested_edge_set(traffic_info: Dict) -> frozenset:
+        """Edges marked as congested in traffic_info"""
+        return frozenset(edge for edge, info in traffic_info.items() if info.get('is_congested'))
+    
+    def _shared_congested_sets(self, agent_data_list: List[Dict]) -> List[frozenset]:
+        """Congested edge set for each agent, computed once per distinct traffic_info"""
+        by_traffic_info = {}
+        sets = []
+        for data in agent_data_list:
+            traffic_info = data.get('traffic_info', {})
+            congested = by_traffic_info.get(id(traffic_info))
+            if congested is None:
+                congested = by_traffic_info[id(traffic_info)] = self.congested_edge_set(traffic_info)
+            sets.append(congested)
+        return sets
+    
+    def _batch_nearest_pois(self, agent_data_list: List[Dict]) -> List[Optional[int]]:
+        """Nearest POI index for every agent that reports a lat_lon, found with one batched query"""
+        nearest = [None] * len(agent_data_list)
+        if not self.pois:
+            return nearest
+        
+        positions = [
+            (i, data['vehicle_data']['lat_lon'])
+            for i, data in enumerate(agent_data_list)
+            if 'lat_lon' in data.get('vehicle_data', {})
+        ]
+        if not positions:
+            return nearest
+        
+        idx = self._nearest_poi_indices([p[1][0] for p in positions], [p[1][1] for p in positions])
+        for (i, _), poi_idx in zip(positions, idx.tolist()):
+            nearest[i] = poi_idx
+        return nearest
+    
     def modify_activity_chain_with_llm(self, agent_id: str, current_chain: List[str], 
-                                      prompt: str, vehicle_data: Dict, traffic_info: Dict) -> Tuple[List[str], List[int]]:
+                                      prompt: str, vehicle_data: Dict, traffic_info: Dict,
+                                      congested_set: Optional[frozenset] = None,
+                                      nearest_poi_idx: Optional[int] = None) -> Tuple[List[str], List[int]]:
         """
         Use LLM to modify an activity chain based on a natural language prompt
+        congested_set: optional precomputed congested_edge_set(traffic_info)
+        nearest_poi_idx: optional precomputed index of the POI nearest to the vehicle's lat_lon
         Returns: Tuple of (list of POI names, list of durations in seconds)
         """
+        prompts = self._llm_prompts_for(agent_id, current_chain, prompt, vehicle_data, traffic_info,
+                                        congested_set, nearest_poi_idx)
+        if prompts is None:
+            return current_chain, []
+
+        try:
+            # Call OpenAI API
+            return self._chain_from_response(self.call_openai_api(*prompts), current_chain)
+        except Exception as e:
+            return self._llm_failure(e, current_chain)
+    
+    def cached_chain(self, agent_id: str, current_chain: List[str], prompt: str,
+                     vehicle_data: Dict, traffic_info: Dict) -> Optional[Tuple[List[str], List[int]]]:
+        """The (POI names, durations) a cached reply gives for this request, or None without calling the LLM"""
+        prompts = self._build_llm_prompts(agent_id, current_chain, prompt, vehicle_data, traffic_info)
+        response = self._get_cached_response(self._llm_cache_key(*prompts))
+        if response is None:
+            return None
+        return self._chain_from_response(response, current_chain)
+    
+    def _llm_prompts_for(self, agent_id: str, current_chain: List[str], prompt: str,
+                         vehicle_data: Dict, traffic_info: Dict,
+                         congested_set: Optional[frozenset] = None,
+                         nearest_poi_idx: Optional[int] = None) -> Optional[Tuple[str, str]]:
+        """Prompt pair for one agent, or None when no API key is configured; shared by the sync and async paths"""
         if not self.api_key:
             print("No API key provided for LLM service")
-            return current_chain, []
+            return None
+        return self._build_llm_prompts(agent_id, current_chain, prompt, vehicle_data, traffic_info,
+                                       congested_set, nearest_poi_idx)
+    
+    def _chain_from_response(self, response: str, current_chain: List[str]) -> Tuple[List[str], List[int]]:
+        """Turn an LLM reply into (POI names, durations); shared by the sync and async paths"""
+        logger.debug("Response: %s", response)
+        return self._parse_llm_response(response, current_chain)
+    
+    @staticmethod
+    def _llm_failure(error: Exception, current_chain: List[str]) -> Tuple[List[str], List[int]]:
+        """Report a failed LLM request and keep the original chain"""
+        print(f"Error modifying activity chain with LLM: {error}")
+        return current_chain, []
+    
+    def clear_agent_context_cache(self):
+        """Forget cached prompt context; called at the start of every batch of LLM requests"""
+        with self._agent_ctx_lock:
+            self._agent_ctx_cache.clear()
+    
+    @staticmethod
+    def _agent_context_key(current_chain: List[str], vehicle_data: Dict) -> Tuple:
+        """Every input the context text depends on: the chain, the POI timings and the demographics"""
+        route_info = vehicle_data.get('route_info', {})
+        timings = tuple(
+            (poi['name'], poi['start_time'], poi['end_time'], poi['stop_duration'])
+            for poi in route_info.get('poi_sequence', [])
+        )
+        demo = route_info.get('demographics')
+        if demo is not None:
+            demo = tuple(demo.get(field, 'unknown') for field in ('age', 'gender', 'student_status', 'income_level'))
+        return tuple(current_chain), timings, demo
+    
+    def _agent_context(self, current_chain: List[str], vehicle_data: Dict) -> Tuple[List[str], List[str], str]:
+        """Timing lines, distance lines and demographics text for an agent, cached on their inputs"""
+        key = self._agent_context_key(current_chain, vehicle_data)
+        with self._agent_ctx_lock:
+            context = self._agent_ctx_cache.get(key)
+        if context is not None:
+            return context
+        
+        poi_sequence = vehicle_data.get('route_info', {}).get('poi_sequence', [])
+        # duration: stop_duration converted from seconds to quarters
+        timing_info = [
+            f"{poi['name']}: {_seconds_to_time_str(poi['start_time'])}-{_seconds_to_time_str(poi['end_time'])} "
+            f"(quarters {_seconds_to_quarters(poi['start_time'])}-{_seconds_to_quarters(poi['end_time'])}, "
+            f"duration: {(poi['stop_duration'] // 60) // 15} quarters)"
+            for poi in poi_sequence
+        ]
+
+        # Get agent demographics
+        demographics = "No demographic information available."
+        if 'route_info' in vehicle_data and 'demographics' in vehicle_data['route_info']:
+            demo = vehicle_data['route_info']['demographics']
+            demographics = (f"Age: {demo.get('age', 'unknown')}, "
+                          f"Gender: {demo.get('gender', 'unknown')}, "
+                          f"Student: {demo.get('student_status', 'unknown')}, "
+                          f"Income: {demo.get('income_level', 'unknown')}")
 
+        # Get distances between POIs
+        distance_info = self.chain_distance_info(current_chain)
+        
+        context = (timing_info, distance_info, demographics)
+        with self._agent_ctx_lock:
+            self._agent_ctx_cache[key] = context
+            if len(self._agent_ctx_cache) > AGENT_CTX_CACHE_SIZE:
+                self._agent_ctx_cache.popitem(last=False)
+        return context
+    
+    def _build_llm_prompts(self, agent_id: str, current_chain: List[str], prompt: str,
+                           vehicle_data: Dict, traffic_info: Dict,
+                           congested_set: Optional[frozenset] = None,
+                           nearest_poi_idx: Optional[int] = None) -> Tuple[str, str]:
+        """Build the (system, user) prompt pair describing an agent's situation"""
         # Get current location and route information
         current_edge = vehicle_data.get('current_edge', '')
         route = vehicle_data.get('route', [])
@@ -205,26 +553,16 @@ class ActivityChainModifier:
         # Find nearest POI to current location
         current_location = "unknown"
         if 'lat_lon' in vehicle_data:
-            lat, lon = vehicle_data['lat_lon'][:2]
-            nearest_poi = self.find_nearest_poi(lat, lon)
-            if nearest_poi:
-                current_location = nearest_poi.get('name', 'unknown')
-        poi_sequence = vehicle_data.get('route_info', {}).get('poi_sequence', [])
-        timing_info = []
-        for poi in poi_sequence:
-            start_quarter = self.seconds_to_quarters(poi['start_time'])
-            end_quarter = self.seconds_to_quarters(poi['end_time'])
-            duration_quarters = (poi['stop_duration'] // 60) // 15  # Convert seconds to quarters
-            start_time_str = self.seconds_to_time_str(poi['start_time'])
-            end_time_str = self.seconds_to_time_str(poi['end_time'])
-            timing_info.append(
-                f"{poi['name']}: {start_time_str}-{end_time_str} "
-                f"(quarters {start_quarter}-{end_quarter}, duration: {duration_quarters} quarters)"
-            )
+            if nearest_poi_idx is None:
+                lat, lon = vehicle_data['lat_lon'][:2]
+                nearest_poi_idx = self._nearest_poi_index(lat, lon)
+            if nearest_poi_idx >= 0:
+                current_location = self._poi_names[nearest_poi_idx] or 'unknown'
+        timing_info, distance_info, demographics = self._agent_context(current_chain, vehicle_data)
         # Process traffic information
         traffic_status = []
-        print(current_edge)
-        print(traffic_info)
+        logger.debug("current_edge=%s", current_edge)
+        logger.debug("traffic_info=%s", traffic_info)
         if current_edge and traffic_info:
             # Check congestion on current edge
             if current_edge in traffic_info:
@@ -234,12 +572,11 @@ class ActivityChainModifier:
                         f"Current location has heavy traffic "
                         f"(road occupancy: {edge_info['occupancy']*100:.0f}%)"
                     )
-            print(remaining_route)
+            logger.debug("remaining_route=%s", remaining_route)
             # Check congestion on remaining route
-            congested_edges = [
-                edge for edge in remaining_route 
-                if edge in traffic_info and traffic_info[edge]['is_congested']
-            ]
+            if congested_set is None:
+                congested_set = self.congested_edge_set(traffic_info)
+            congested_edges = [edge for edge in remaining_route if edge in congested_set]
             
             if congested_edges:
                 avg_occupancy = sum(traffic_info[e]['occupancy'] for e in congested_edges) / len(congested_edges)
@@ -248,41 +585,8 @@ class ActivityChainModifier:
                     f"(average occupancy: {avg_occupancy*100:.0f}%)"
                 )
 
-        # Get agent demographics
-        demographics = "No demographic information available."
-        if 'route_info' in vehicle_data and 'demographics' in vehicle_data['route_info']:
-            demo = vehicle_data['route_info']['demographics']
-            demographics = (f"Age: {demo.get('age', 'unknown')}, "
-                          f"Gender: {demo.get('gender', 'unknown')}, "
-                          f"Student: {demo.get('student_status', 'unknown')}, "
-                          f"Income: {demo.get('income_level', 'unknown')}")
-
-        # Get distances between POIs
-        distance_info = []
-        for i in range(len(current_chain) - 1):
-            dist = self.get_distance_between_pois(current_chain[i], current_chain[i+1])
-            if dist:
-                distance_info.append(f"Distance from {current_chain[i]} to {current_chain[i+1]}: {dist:.2f} km")
-        
         # Construct the prompt for the LLM
-        system_prompt = """
-        You are an AI assistant that helps modify activity chains for agents in a simulation.
-        Given the current activity chain with timing information, agent's current location, demographics, traffic conditions, and event timing, suggest a modified chain that makes sense.
-        
-        The activity chain should respect the event timing - make sure the agent is at the event location during the specified event time.
-        If there are conflicting activities during the event time, reschedule them to before or after the event.
-        
-        Only respond with the new activity chain as a comma-separated list of POI names and durations in quarters (15-minute blocks).
-        Format: POI_name:quarters, POI_name:quarters, ...
-        Example: Falafel Inc.:32, Starbucks:4, UCLA_Parking_Lot_2:16, Ralphs:8, Falafel Inc.:36
-        
-        Each quarter represents 15 minutes, so:
-        - 4 quarters = 1 hour
-        - 32 quarters = 8 hours
-        - 96 quarters = 24 hours
-        
-        Do not include any explanations or additional text.
-        """
+        system_prompt = _SYSTEM_PROMPT
         
         user_prompt = f"""
         Agent ID: {agent_id}
@@ -301,45 +605,30 @@ class ActivityChainModifier:
         Only include POI names that exist in the current chain or are well-known locations.
         Each quarter represents 15 minutes, so 4 quarters = 1 hour.
         """
-        print(f"User prompt: {user_prompt}")
-
-        try:
-            # Call OpenAI API
-            response = self.call_openai_api(system_prompt, user_prompt)
-            print(f"Response: {response}")
-            
-            # Parse the response (now includes durations in quarters)
-            new_chain_with_duration = [item.strip() for item in response.split(',')]
-            
-            # Convert to list of POIs and durations
-            valid_chain = []
-            durations = []  # durations in seconds
-            
-            for item in new_chain_with_duration:
-                try:
-                    poi_name, quarters = item.split(':')
-                    poi_name = poi_name.strip()
-                    quarters = int(quarters.strip())
-                    
-                    if self.get_poi_by_name(poi_name) or poi_name in current_chain:
-                        valid_chain.append(poi_name)
-                        # Convert quarters to seconds (1 quarter = 15 minutes = 900 seconds)
-                        durations.append(quarters * 900)
-                except ValueError:
-                    print(f"Warning: Invalid format for item '{item}'")
-            
-            if not valid_chain:
-                print("No valid POIs in the modified chain, keeping original")
-                return current_chain, []
-                
-            return valid_chain, durations
-            
-        except Exception as e:
-            print(f"Error modifying activity chain with LLM: {e}")
+        logger.debug("User prompt: %s", user_prompt)
+        return system_prompt, user_prompt
+    
+    def _parse_llm_response(self, response: str, current_chain: List[str]) -> Tuple[List[str], List[int]]:
+        """Turn a 'POI_name:quarters, ...' reply into (POI names, durations in seconds)"""
+        # Parse the response (now includes durations in quarters); items that
+        # are not exactly 'name:quarters' do not match and are skipped
+        valid_chain = []
+        durations = []  # durations in seconds
+        
+        for poi_name, quarters in _CHAIN_RE.findall(response):
+            if poi_name in self._poi_by_name or poi_name in current_chain:
+                valid_chain.append(poi_name)
+                # Convert quarters to seconds (1 quarter = 15 minutes = 900 seconds)
+                durations.append(int(quarters) * 900)
+        
+        if not valid_chain:
+            print("No valid POIs in the modified chain, keeping original")
             return current_chain, []
+            
+        return valid_chain, durations
     
-    def call_openai_api(self, system_prompt: str, user_prompt: str) -> str:
-        """Call the OpenAI API to get a response"""
+    def _openai_request(self, system_prompt: str, user_prompt: str) -> Tuple[str, Dict, Dict]:
+        """URL, headers and JSON body of a chat completion request"""
         url = "https://api.openai.com/v1/chat/completions"
         
         headers = {
@@ -355,13 +644,174 @@ class ActivityChainModifier:
             ],
             "temperature": 1.0
         }
+        return url, headers, data
+    
+    @staticmethod
+    def _llm_cache_key(system_prompt: str, user_prompt: str) -> bytes:
+        return hashlib.blake2b((system_prompt + "\0" + user_prompt).encode(), digest_size=16).digest()
+    
+    def _get_cached_response(self, key: bytes) -> Optional[str]:
+        with self._llm_cache_lock:
+            return self._cached_response_locked(key)
+    
+    def _cached_response_locked(self, key: bytes) -> Optional[str]:
+        """Cache lookup for callers already holding _llm_cache_lock; expired replies are dropped"""
+        entry = self._llm_cache.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] > LLM_CACHE_TTL:
+            del self._llm_cache[key]
+            return None
+        self._llm_cache.move_to_end(key)
+        return entry[1]
+    
+    def _cache_response(self, key: bytes, response: str):
+        with self._llm_cache_lock:
+            self._llm_cache[key] = (time.monotonic(), response)
+            self._llm_cache.move_to_end(key)
+            if len(self._llm_cache) > LLM_CACHE_SIZE:
+                self._llm_cache.popitem(last=False)
+    
+    def call_openai_api(self, system_prompt: str, user_prompt: str) -> str:
+        """Call the OpenAI API to get a response"""
+        key = self._llm_cache_key(system_prompt, user_prompt)
+        cached = self._get_cached_response(key)
+        if cached is not None:
+            return cached
+        
+        # Workers sending an identical prompt at the same time share one request
+        with self._llm_cache_lock:
+            # An owner may have cached its reply and finished since the check above
+            cached = self._cached_response_locked(key)
+            if cached is not None:
+                return cached
+            pending = self._llm_inflight.get(key)
+            owner = pending is None
+            if owner:
+                pending = self._llm_inflight[key] = concurrent.futures.Future()
+        if not owner:
+            return pending.result()
+        
+        try:
+            url, headers, data = self._openai_request(system_prompt, user_prompt)
+            response = self._http.post(url, headers=headers, json=data, timeout=(5, 60))
+            
+            if response.status_code == 200:
+                content = response.json()["choices"][0]["message"]["content"].strip()
+                self._cache_response(key, content)
+                pending.set_result(content)
+                return content
+            else:
+                raise Exception(f"API call failed with status {response.status_code}: {response.text}")
+        except Exception as e:
+            pending.set_exception(e)
+            raise
+        finally:
+            with self._llm_cache_lock:
+                self._llm_inflight.pop(key, None)
+    
+    @staticmethod
+    async def _post_with_retries(client, url, headers, data):
+        """POST with the same retry/backoff policy the requests session uses"""
+        for attempt in range(RETRY_TOTAL + 1):
+            last_try = attempt == RETRY_TOTAL
+            try:
+                response = await client.post(url, headers=headers, json=data)
+            except httpx.TransportError:
+                if last_try:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or last_try:
+                    return response
+            await asyncio.sleep(RETRY_BACKOFF * (2 ** attempt))
+    
+    async def _call_openai_api_async(self, client, system_prompt: str, user_prompt: str,
+                                     inflight: Dict[bytes, "asyncio.Future"]) -> str:
+        """Async variant of call_openai_api using a shared httpx.AsyncClient"""
+        key = self._llm_cache_key(system_prompt, user_prompt)
+        cached = self._get_cached_response(key)
+        if cached is not None:
+            return cached
+        
+        # Coroutines sending an identical prompt in this batch share one request
+        pending = inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        pending = inflight[key] = asyncio.get_running_loop().create_future()
+        
+        try:
+            url, headers, data = self._openai_request(system_prompt, user_prompt)
+            response = await self._post_with_retries(client, url, headers, data)
+            
+            if response.status_code == 200:
+                content = response.json()["choices"][0]["message"]["content"].strip()
+                self._cache_response(key, content)
+                pending.set_result(content)
+                return content
+            else:
+                raise Exception(f"API call failed with status {response.status_code}: {response.text}")
+        except asyncio.CancelledError:
+            pending.cancel()
+            raise
+        except Exception as e:
+            pending.set_exception(e)
+            # Mark the exception as retrieved in case no other coroutine waits on it
+            pending.exception()
+            raise
+        finally:
+            inflight.pop(key, None)
+    
+    async def _modify_one_async(self, client, data: Dict, inflight: Dict[bytes, "asyncio.Future"],
+                                congested_set: Optional[frozenset] = None,
+                                nearest_poi_idx: Optional[int] = None) -> Tuple[List[str], List[int]]:
+        """Async variant of modify_activity_chain_with_llm for one agent_data_list entry"""
+        current_chain = data['current_chain']
+        # Prompt construction is cheap and synchronous; only the HTTP call is awaited
+        prompts = self._llm_prompts_for(data['agent_id'], current_chain, data['prompt'],
+                                        data.get('vehicle_data', {}), data.get('traffic_info', {}),
+                                        congested_set, nearest_poi_idx)
+        if prompts is None:
+            return current_chain, []
+        
+        try:
+            response = await self._call_openai_api_async(client, *prompts, inflight)
+            return self._chain_from_response(response, current_chain)
+        except Exception as e:
+            return self._llm_failure(e, current_chain)
+    
+    async def modify_activity_chains_async(self, agent_data_list: List[Dict]) -> Dict[str, Tuple[List[str], List[int]]]:
+        """
+        Process multiple agents concurrently on one event loop
+        
+        Takes the same agent_data_list as modify_activity_chains_parallel. Without
+        httpx installed the thread pool implementation is run in a worker thread.
+        """
+        if httpx is None:
+            return await asyncio.to_thread(self._modify_chains_threaded, agent_data_list)
         
-        response = requests.post(url, headers=headers, json=data)
+        congested_sets = self._shared_congested_sets(agent_data_list)
+        nearest_pois = self._batch_nearest_pois(agent_data_list)
+        # Bound in-flight requests so large batches don't all build prompts and queue at once
+        semaphore = asyncio.Semaphore(self.max_workers)
+        # Futures belong to this call's event loop, so the coalescing map does too
+        inflight: Dict[bytes, asyncio.Future] = {}
         
-        if response.status_code == 200:
-            return response.json()["choices"][0]["message"]["content"].strip()
-        else:
-            raise Exception(f"API call failed with status {response.status_code}: {response.text}")
+        async def modify_one(client, data, congested, nearest):
+            async with semaphore:
+                return await self._modify_one_async(client, data, inflight, congested, nearest)
+        
+        limits = httpx.Limits(max_connections=200, max_keepalive_connections=self.max_workers)
+        async with httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(60.0, connect=5.0)) as client:
+            chains = await asyncio.gather(*[
+                modify_one(client, data, congested, nearest)
+                for data, congested, nearest in zip(agent_data_list, congested_sets, nearest_pois)
+            ])
+        
+        results = {}
+        for data, result in zip(agent_data_list, chains):
+            results[data['agent_id']] = result
+            print(f"Completed processing for agent {data['agent_id']}")
+        return results
     
     def modify_activity_chains_parallel(self, agent_data_list: List[Dict]) -> Dict[str, List[str]]:
         """
@@ -377,8 +827,47 @@ class ActivityChainModifier:
         }
         
         Returns a dictionary mapping agent_id to their new activity chains
+        
+        Agents with the same (current_chain, prompt) share one LLM call: the first
+        agent of each group is sent and its reply is given to the whole group.
         """
+        # Each batch is a new simulation step
+        self.clear_agent_context_cache()
+        
+        groups = {}
+        for data in agent_data_list:
+            groups.setdefault((tuple(data['current_chain']), data['prompt']), []).append(data)
+        leaders = [members[0] for members in groups.values()]
+        if len(leaders) < len(agent_data_list):
+            print(f"Grouped {len(agent_data_list)} agents into {len(leaders)} LLM requests")
+        
+        results = self._modify_chains(leaders)
+        
+        # Broadcast each group's reply to its other members
+        for members in groups.values():
+            new_chain, durations = results.get(members[0]['agent_id'], (members[0]['current_chain'], []))
+            for data in members[1:]:
+                results[data['agent_id']] = (list(new_chain), list(durations))
+        return results
+    
+    def _modify_chains(self, agent_data_list: List[Dict]) -> Dict[str, Tuple[List[str], List[int]]]:
+        """Send one LLM request per entry of agent_data_list"""
+        # Multiplex all requests on one event loop when opted in
+        if self.use_async:
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                return asyncio.run(self.modify_activity_chains_async(agent_data_list))
+        
+        return self._modify_chains_threaded(agent_data_list)
+    
+    def _modify_chains_threaded(self, agent_data_list: List[Dict]) -> Dict[str, List[str]]:
+        """Thread pool fallback for modify_activity_chains_parallel"""
         results = {}
+        # Agents usually share one traffic_info, so its congested edges are found once
+        congested_sets = self._shared_congested_sets(agent_data_list)
+        nearest_pois = self._batch_nearest_pois(agent_data_list)
+        agent_by_id = {data['agent_id']: data for data in agent_data_list}
         
         with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
             # Submit all tasks
@@ -389,9 +878,11 @@ class ActivityChainModifier:
                     data['current_chain'],
                     data['prompt'],
                     data.get('vehicle_data', {}),
-                    data.get('traffic_info', {})
+                    data.get('traffic_info', {}),
+                    congested,
+                    nearest
                 ): data['agent_id']
-                for data in agent_data_list
+                for data, congested, nearest in zip(agent_data_list, congested_sets, nearest_pois)
             }
             
             # Process results as they complete
@@ -404,7 +895,7 @@ class ActivityChainModifier:
                 except Exception as e:
                     print(f"Error processing agent {agent_id}: {e}")
                     # In case of error, keep the original chain
-                    agent_data = next((data for data in agent_data_list if data['agent_id'] == agent_id), None)
+                    agent_data = agent_by_id.get(agent_id)
                     if agent_data:
                         results[agent_id] = (agent_data['current_chain'], [])
         
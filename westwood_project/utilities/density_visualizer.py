@@ -1,3 +1,4 @@
+import os
 import tkinter as tk
 from tkinter import ttk
 import socket
@@ -6,12 +7,44 @@ import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from matplotlib.figure import Figure
+from matplotlib.collections import LineCollection
 import seaborn as sns
 import sumolib
 import threading
 import time
 import traceback
 import errno
+import selectors
+import struct
+try:
+    from . import json_codec
+except ImportError:
+    import json_codec  # run directly as a script from utilities/
+
+FRAME_START = b"<<START>>"
+FRAME_HEADER = struct.Struct('>I')  # big-endian payload length following FRAME_START
+RECV_SIZE = 65536
+SOCKET_BUFFER_SIZE = 4 << 20
+NET_FILE = '../sumo_config/westwood.net.xml'
+ROAD_CACHE_FILE = '../cache/road_network.npz'
+
+def parse_frame_header(buf, start_idx=-1, scan_from=0):
+    """Locate FRAME_START in buf and decode the payload length that follows it
+
+    Returns (start_idx, size): start_idx is -1 until the marker is found and size is
+    None until the whole length header has arrived. Pass start_idx back in on the next
+    call; scan_from is where the newly received bytes begin.
+    """
+    if start_idx < 0:
+        # Overlap the previous bytes in case the marker was split across reads
+        start_idx = buf.find(FRAME_START, max(0, scan_from - len(FRAME_START) + 1))
+        if start_idx < 0:
+            return -1, None
+    header_end = start_idx + len(FRAME_START) + FRAME_HEADER.size
+    if len(buf) < header_end:
+        return start_idx, None
+    (size,) = FRAME_HEADER.unpack_from(buf, header_end - FRAME_HEADER.size)
+    return start_idx, size
 
 class DensityVisualizer:
     def __init__(self, host='localhost', port=8814):
@@ -27,9 +60,12 @@ class DensityVisualizer:
             [3000, 3000]   # max_x, max_y
         ]
         self.road_network = None
-        self.density_grid = np.zeros((100, 100))  # Increase grid size for better resolution
+        self.density_grid = np.zeros((100, 100), dtype=np.float32)  # Increase grid size for better resolution
         self.grid_size = 100
+        self._blur = self._blur_matrix()  # Gaussian spread is constant, build it once
         self.colorbar = None
+        self._im = None  # persistent heatmap artist, redrawn by blitting
+        self._bg = None  # cached axes background without the heatmap
         
         # Create main frame
         self.main_frame = ttk.Frame(self.root, padding="5")
@@ -56,6 +92,7 @@ class DensityVisualizer:
         self.host = host
         self.port = port
         self.socket = None
+        self._sel = None
         self.connected = False
         
         # Extract road network on startup
@@ -63,9 +100,42 @@ class DensityVisualizer:
         self.update_visualization()
         
     def extract_road_network(self):
-        """Extract road network from SUMO network file"""
+        """Extract road network from SUMO network file, reusing the on-disk cache when fresh"""
+        road_lines = self._load_road_cache()
+        if road_lines is not None:
+            return road_lines
+        
+        road_lines = self._parse_road_network()
+        if road_lines:
+            self._save_road_cache(road_lines)
+        return road_lines
+        
+    def _load_road_cache(self):
+        """Load cached road polylines if the cache is newer than the net file and bounds match"""
+        try:
+            if os.path.getmtime(ROAD_CACHE_FILE) < os.path.getmtime(NET_FILE):
+                return None
+            with np.load(ROAD_CACHE_FILE) as data:
+                if not np.array_equal(data['bounds'], self.bounds):
+                    return None
+                return np.split(data['points'], data['splits'])
+        except (OSError, KeyError, ValueError):
+            return None
+        
+    def _save_road_cache(self, road_lines):
+        """Store road polylines as one point array plus split offsets"""
         try:
-            net = sumolib.net.readNet('../sumo_config/westwood.net.xml')
+            os.makedirs(os.path.dirname(ROAD_CACHE_FILE), exist_ok=True)
+            splits = np.cumsum([len(line) for line in road_lines])[:-1]
+            np.savez(ROAD_CACHE_FILE, points=np.concatenate(road_lines), splits=splits,
+                     bounds=np.array(self.bounds))
+        except OSError as e:
+            print(f"Could not write road network cache: {e}")
+        
+    def _parse_road_network(self):
+        """Parse road polylines within bounds from the SUMO network file"""
+        try:
+            net = sumolib.net.readNet(NET_FILE)
             
             road_lines = []
             min_x, min_y = self.bounds[0]
@@ -86,13 +156,23 @@ class DensityVisualizer:
             print(f"Error extracting road network: {e}")
             return []
         
+    def _blur_matrix(self, sigma=2.0, radius=4):
+        """Banded matrix applying the truncated Gaussian spread along one grid axis"""
+        cells = np.arange(self.grid_size)
+        offsets = cells[:, None] - cells[None, :]
+        weights = np.exp(-offsets**2 / (2 * sigma**2))
+        return np.where(np.abs(offsets) <= radius, weights, 0.0).astype(np.float32)
+        
     def connect(self):
         """Establish connection to SUMO controller and get network bounds"""
         try:
             # Create socket and connect
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
             self.socket.connect((self.host, self.port))
             self.socket.setblocking(False)
+            self._sel = selectors.DefaultSelector()
+            self._sel.register(self.socket, selectors.EVENT_READ)
             self.connected = True
             
             # Update button states
@@ -110,7 +190,7 @@ class DensityVisualizer:
             print(f"Set visualization bounds to: x=[{self.bounds[0][0]}, {self.bounds[1][0]}], y=[{self.bounds[0][1]}, {self.bounds[1][1]}]")
             
             # Initialize the density grid
-            self.density_grid = np.zeros((self.grid_size, self.grid_size))
+            self.density_grid = np.zeros((self.grid_size, self.grid_size), dtype=np.float32)
             self.update_visualization()
             
         except Exception as e:
@@ -119,6 +199,9 @@ class DensityVisualizer:
 
     def disconnect(self):
         """Close connection to SUMO controller"""
+        if self._sel:
+            self._sel.close()
+            self._sel = None
         if self.socket:
             self.socket.close()
             self.socket = None
@@ -147,7 +230,6 @@ class DensityVisualizer:
 
         try:
             # First, clear our socket buffer to avoid interference
-            self.socket.setblocking(False)
             try:
                 # Clear any pending data from previous requests
                 while True:
@@ -160,93 +242,87 @@ class DensityVisualizer:
             except:
                 pass
             
-            # Set a short timeout for better control
-            self.socket.settimeout(0.5)
-            
             # Send request for vehicle data
             print("Requesting all vehicle data...")
             self.socket.send("GET_ALL_VEHICLES".encode())
             
-            # Read the complete response with reliable framing
-            complete_buffer = ""
-            start_found = False
-            end_found = False
+            # Read the complete response: FRAME_START, a length header, then the payload
+            buf = bytearray()
+            start_idx = -1
+            payload = None
+            got = 0
             
-            # Keep receiving until we get a complete message
-            timeout_start = time.time()
-            timeout_limit = 5  # 5 seconds total timeout
+            # Wait on the selector until the complete message arrives
+            deadline = time.monotonic() + 5  # 5 seconds total timeout
             
-            while time.time() - timeout_start < timeout_limit:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._sel.select(timeout=remaining):
+                    print("Timed out waiting for vehicle data")
+                    break
                 try:
-                    chunk = self.socket.recv(16384).decode()  # Increased buffer size
-                    if not chunk:
-                        time.sleep(0.1)
-                        continue
-                        
-                    complete_buffer += chunk
-                    print(f"Received chunk of {len(chunk)} bytes")
-                    print(f"Current buffer size: {len(complete_buffer)} bytes")
-                    
-                    # Check for complete message
-                    if "<<START>>" in complete_buffer and "<<END>>" in complete_buffer:
-                        start_idx = complete_buffer.find("<<START>>")
-                        end_idx = complete_buffer.find("<<END>>", start_idx)
-                        if end_idx > start_idx:
-                            print("Found complete message")
-                            break
-                            
-                except socket.timeout:
-                    print("Socket timeout, continuing...")
+                    if payload is not None:
+                        # Length is known, read the rest straight into the payload buffer
+                        received = self.socket.recv_into(payload_view[got:])
+                    else:
+                        chunk = self.socket.recv(RECV_SIZE)
+                        received = len(chunk)
+                except BlockingIOError:
                     continue
-                except Exception as e:
+                except OSError as e:
                     print(f"Socket error: {e}")
                     break
-            
-            # Reset socket to non-blocking for other operations
-            self.socket.setblocking(False)
+                if not received:
+                    print("Connection closed by SUMO controller")
+                    break
+                
+                if payload is not None:
+                    got += received
+                else:
+                    old_len = len(buf)
+                    buf += chunk
+                    print(f"Received chunk of {len(chunk)} bytes")
+                    
+                    # Skip any periodic frames queued ahead of the reply; only the new
+                    # bytes are scanned for the marker
+                    start_idx, size = parse_frame_header(buf, start_idx, old_len)
+                    if size is None:
+                        continue
+                    
+                    # Allocate the payload once and move over what already arrived
+                    header_end = start_idx + len(FRAME_START) + FRAME_HEADER.size
+                    payload = bytearray(size)
+                    payload_view = memoryview(payload)
+                    got = min(size, len(buf) - header_end)
+                    payload_view[:got] = buf[header_end:header_end + got]
+                    buf = None
+                
+                if got == len(payload):
+                    print("Found complete message")
+                    break
             
             # Check if we have a complete message
-            if not ("<<START>>" in complete_buffer and "<<END>>" in complete_buffer):
+            if payload is None or got < len(payload):
                 print("Failed to receive a complete message")
                 return
                 
-            # Extract the message between markers
-            print("Extracting message between markers...")
+            message = payload_view
+            print(f"Successfully extracted message of length {len(message)}")
             
-            try:
-                # Split by START marker and take everything after it
-                if "<<START>>" not in complete_buffer:
-                    print("START marker not found in final buffer")
-                    return
-                    
-                _, after_start = complete_buffer.split("<<START>>", 1)
-                
-                # Split by END marker and take everything before it
-                if "<<END>>" not in after_start:
-                    print("END marker not found in message after START")
-                    return
-                    
-                message, _ = after_start.split("<<END>>", 1)
-                print(f"Successfully extracted message of length {len(message)}")
-                
-                # Debug: Show the start and end of the message
-                print(f"Message starts with: {message[:50]}")
-                print(f"Message ends with: {message[-50:]}")
-                
-            except Exception as e:
-                print(f"Error during message extraction: {e}")
-                return
+            # Debug: Show the start and end of the message
+            print(f"Message starts with: {bytes(message[:50]).decode(errors='replace')}")
+            print(f"Message ends with: {bytes(message[-50:]).decode(errors='replace')}")
             
             # Process the extracted message
             if not message:
                 print("Extracted message is empty")
                 return
                 
-            print(f"Message preview: {message[:100]}...")
+            print(f"Message preview: {bytes(message[:100]).decode(errors='replace')}...")
 
             try:
                 # Parse the JSON message
-                vehicle_data = json.loads(message)
+                vehicle_data = json_codec.loads(message)
                 
                 # Get vehicle count
                 vehicle_count = vehicle_data.get('vehicle_count', 0)
@@ -271,38 +347,23 @@ class DensityVisualizer:
                 x_min, y_min = self.bounds[0]
                 x_max, y_max = self.bounds[1]
                 
-                # Clear the density grid
-                self.density_grid = np.zeros((self.grid_size, self.grid_size))
+                # Collect positions into one array and keep those within bounds
+                pos = np.array([data['position'][:2] for data in vehicles.values() if 'position' in data],
+                               dtype=np.float32).reshape(-1, 2)
+                in_bounds = ((pos[:, 0] >= x_min) & (pos[:, 0] <= x_max) &
+                             (pos[:, 1] >= y_min) & (pos[:, 1] <= y_max))
+                vehicles_out_of_bounds = len(pos) - int(in_bounds.sum())
+                pos = pos[in_bounds]
+                vehicles_processed = len(pos)
                 
-                # Process each vehicle
-                vehicles_processed = 0
-                vehicles_out_of_bounds = 0
+                # Convert to grid coordinates and count vehicles per cell
+                gx = ((pos[:, 0] - x_min) * ((self.grid_size - 1) / (x_max - x_min))).astype(np.int32)
+                gy = ((pos[:, 1] - y_min) * ((self.grid_size - 1) / (y_max - y_min))).astype(np.int32)
+                counts = np.bincount(gy * self.grid_size + gx, minlength=self.grid_size * self.grid_size)
+                counts = counts.reshape(self.grid_size, self.grid_size).astype(np.float32)
                 
-                for vid, data in vehicles.items():
-                    if 'position' in data:
-                        pos = data['position']
-                        x, y = pos[0], pos[1]
-                        
-                        # Check if position is within bounds
-                        if x_min <= x <= x_max and y_min <= y <= y_max:
-                            # Convert to grid coordinates
-                            grid_x = int((x - x_min) / (x_max - x_min) * (self.grid_size - 1))
-                            grid_y = int((y - y_min) / (y_max - y_min) * (self.grid_size - 1))
-                            
-                            # Apply Gaussian spread
-                            sigma = 2.0  # Increased spread for better visibility
-                            x_range = np.arange(max(0, grid_x-4), min(self.grid_size, grid_x+5))
-                            y_range = np.arange(max(0, grid_y-4), min(self.grid_size, grid_y+5))
-                            X, Y = np.meshgrid(x_range, y_range)
-                            gaussian = np.exp(-((X-grid_x)**2 + (Y-grid_y)**2)/(2*sigma**2))
-                            
-                            # Add to density grid
-                            x_indices = slice(max(0, grid_x-4), min(self.grid_size, grid_x+5))
-                            y_indices = slice(max(0, grid_y-4), min(self.grid_size, grid_y+5))
-                            self.density_grid[y_indices, x_indices] += gaussian
-                            vehicles_processed += 1
-                        else:
-                            vehicles_out_of_bounds += 1
+                # Spread the counts with the Gaussian kernel along both axes
+                self.density_grid = self._blur @ counts @ self._blur
                 
                 print(f"Processed {vehicles_processed} vehicles, {vehicles_out_of_bounds} out of bounds")
                 
@@ -313,7 +374,7 @@ class DensityVisualizer:
                 
             except json.JSONDecodeError as e:
                 print(f"Error decoding JSON: {e}")
-                print(f"Message preview: {message[:100]}...")
+                print(f"Message preview: {bytes(message[:100]).decode(errors='replace')}...")
             except Exception as e:
                 print(f"Error processing data: {e}")
                 traceback.print_exc()
@@ -327,82 +388,69 @@ class DensityVisualizer:
         if not self.bounds or self.density_grid is None:
             return
 
-        # Clear the current plot
-        self.ax.clear()
-
-        # Plot road network if available
-        if self.road_network is not None:
-            for line in self.road_network:
-                self.ax.plot(line[:, 0], line[:, 1], color='lightgray', linewidth=0.8, alpha=0.9)
-
-        # Create heatmap
-        x_min, y_min = self.bounds[0]
-        x_max, y_max = self.bounds[1]
-        extent = [x_min, x_max, y_min, y_max]
-        
         # Normalize the density grid for better visualization
-        if np.max(self.density_grid) > 0:
-            normalized_grid = self.density_grid / np.max(self.density_grid)
+        peak = self.density_grid.max()
+        if peak > 0:
+            normalized_grid = self.density_grid / peak
         else:
             normalized_grid = self.density_grid
         
-        im = self.ax.imshow(normalized_grid, 
-                           extent=extent,
-                           origin='lower',
-                           cmap='viridis',
-                           alpha=0.7)
-
-        # Update or create colorbar
-        if self.colorbar is None:
-            self.colorbar = self.fig.colorbar(im)
-            self.colorbar.ax.tick_params(labelsize=20)
+        # Build the static plot once, afterwards only swap the heatmap data
+        if self._im is None:
+            self._init_plot(normalized_grid)
         else:
-            self.colorbar.update_normal(im)
-            self.colorbar.ax.tick_params(labelsize=20)
+            self._im.set_data(normalized_grid)
 
-        # Set plot limits
-        # Focus on areas with activity rather than full bounds
-        nonzero = np.nonzero(self.density_grid)
-        if len(nonzero[0]) > 0 and len(nonzero[1]) > 0:
-            # Convert grid indices to map coordinates
-            min_y_idx, max_y_idx = np.min(nonzero[0]), np.max(nonzero[0])
-            min_x_idx, max_x_idx = np.min(nonzero[1]), np.max(nonzero[1])
-            
-            # Add some margin
-            margin = 5  # grid cells
-            min_y_idx = max(0, min_y_idx - margin)
-            max_y_idx = min(self.grid_size - 1, max_y_idx + margin)
-            min_x_idx = max(0, min_x_idx - margin)
-            max_x_idx = min(self.grid_size - 1, max_x_idx + margin)
-            
-            # Convert to map coordinates
-            map_min_x = x_min + (min_x_idx / (self.grid_size - 1)) * (x_max - x_min)
-            map_max_x = x_min + (max_x_idx / (self.grid_size - 1)) * (x_max - x_min)
-            map_min_y = y_min + (min_y_idx / (self.grid_size - 1)) * (y_max - y_min)
-            map_max_y = y_min + (max_y_idx / (self.grid_size - 1)) * (y_max - y_min)
-            
-            # Add extra margin in map coordinates
-            x_margin = (map_max_x - map_min_x) * 0.2
-            y_margin = (map_max_y - map_min_y) * 0.2
-            
-            self.ax.set_xlim(map_min_x - x_margin, map_max_x + x_margin)
-            self.ax.set_ylim(map_min_y - y_margin, map_max_y + y_margin)
+        # Refresh canvas
+        self._blit()
 
-            self.ax.set_xlim(x_min, x_max)
-            self.ax.set_ylim(y_min, y_max)
-        else:
-            # Fall back to full bounds if no activity
-            self.ax.set_xlim(x_min, x_max)
-            self.ax.set_ylim(y_min, y_max)
+    def _init_plot(self, normalized_grid):
+        """Create the road network, heatmap, colorbar and labels once"""
+        x_min, y_min = self.bounds[0]
+        x_max, y_max = self.bounds[1]
+        extent = [x_min, x_max, y_min, y_max]
+        
+        # Plot road network if available, as a single collection artist
+        if self.road_network:
+            self.ax.add_collection(LineCollection(self.road_network, colors='lightgray',
+                                                  linewidths=0.8, alpha=0.9))
+        
+        # The heatmap is animated so full draws leave it out of the cached background
+        self._im = self.ax.imshow(normalized_grid,
+                                  extent=extent,
+                                  origin='lower',
+                                  cmap='viridis',
+                                  alpha=0.7,
+                                  vmin=0, vmax=1,
+                                  animated=True)
+        self.colorbar = self.fig.colorbar(self._im)
+        self.colorbar.ax.tick_params(labelsize=20)
+        
+        self.ax.set_xlim(x_min, x_max)
+        self.ax.set_ylim(y_min, y_max)
         
         # Add title and labels
         self.ax.set_title('Vehicle Density Heatmap', fontsize=20)
         self.ax.set_xlabel('X Position (m)', fontsize=20)
         self.ax.set_ylabel('Y Position (m)', fontsize=20)
         self.ax.tick_params(axis='both', which='major', labelsize=16)
-
-        # Refresh canvas
-        self.canvas.draw()
+        
+        # Recapture the background whenever the canvas is fully redrawn (e.g. resize)
+        self.canvas.mpl_connect('draw_event', self._on_draw)
+        
+    def _on_draw(self, event):
+        """Cache the axes background after a full draw and paint the heatmap over it"""
+        self._bg = self.canvas.copy_from_bbox(self.ax.bbox)
+        self.ax.draw_artist(self._im)
+        
+    def _blit(self):
+        """Redraw only the heatmap on top of the cached background"""
+        if self._bg is None:
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self._bg)
+        self.ax.draw_artist(self._im)
+        self.canvas.blit(self.ax.bbox)
 
     def run(self):
         """Start the visualizer"""
@@ -1,6 +1,16 @@
 import math
 from typing import Dict, List, Tuple
 import json
+import xml.etree.ElementTree as ET
+import numpy as np
+
+WESTWOOD_CENTER = (34.0689, -118.4452)  # fallback location when an agent or POI can't be resolved
+MAX_AGE = 120  # ages above this share the last age bucket
+INCOME_PERCENTILES = {
+    "Low": 20,
+    "Medium": 50,
+    "High": 90
+}
 
 class EventHandler:
     def __init__(self):
@@ -33,6 +43,52 @@ class EventHandler:
                 "income_factor": lambda percentile: 1.2 if percentile > 80 else 1.0
             }
         }
+        
+        # Resolve the age predicates once into per-age lookup tables
+        for event_config in self.event_types.values():
+            table = np.ones(MAX_AGE + 1)
+            for age in range(MAX_AGE + 1):
+                for age_check, factor in event_config['age_factors']:
+                    if age_check(age):
+                        table[age] *= factor
+                        break
+            event_config['age_table'] = table
+        
+        # Static inputs for distance scoring, loaded once instead of per agent
+        self.route_info = self._load_route_info()
+        self.route_by_id = {}
+        for info in self.route_info:
+            self.route_by_id.setdefault(info['agent_id'], info)
+        self._poi_by_edge, self._poi_by_name = self._load_poi_coordinates()
+
+    def _load_route_info(self) -> List[Dict]:
+        """Load agent route information from route_info.json."""
+        try:
+            with open('../data/route_info.json', 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Error loading route info: {e}")
+            return []
+
+    def _load_poi_coordinates(self) -> Tuple[Dict[str, Tuple[float, float]], Dict[str, Tuple[float, float]]]:
+        """Index POI coordinates by edge and by name from pois.add.xml (first match wins)."""
+        by_edge, by_name = {}, {}
+        try:
+            root = ET.parse('../poi/pois.add.xml').getroot()
+            for poi in root.findall('poi'):
+                lat, lon = poi.get('lat'), poi.get('lon')
+                if lat is None or lon is None:
+                    continue
+                coords = (float(lat), float(lon))
+                by_edge.setdefault(poi.get('edge'), coords)
+                by_name.setdefault(poi.get('name'), coords)
+        except Exception as e:
+            print(f"Error loading POI coordinates: {e}")
+        return by_edge, by_name
+
+    def age_factor(self, event_config: Dict, age: int) -> float:
+        """Look up the age factor for an event type from its precomputed table."""
+        return event_config['age_table'][min(max(int(age), 0), MAX_AGE)]
 
     def haversine_distance(self, lat1: float, lon1: float, lat2: float, lon2: float) -> float:
         """Calculate the great circle distance between two points in kilometers."""
@@ -46,156 +102,94 @@ class EventHandler:
         c = 2 * math.asin(math.sqrt(a))
         return R * c
 
+    def haversine_batch(self, lats1: np.ndarray, lons1: np.ndarray, lat2: float, lon2: float) -> np.ndarray:
+        """Great circle distances in kilometers from arrays of points to a single point."""
+        R = 6371  # Earth's radius in kilometers
+
+        lats1, lons1 = np.radians(lats1), np.radians(lons1)
+        lat2, lon2 = math.radians(lat2), math.radians(lon2)
+        dlat = lat2 - lats1
+        dlon = lon2 - lons1
+
+        a = np.sin(dlat/2)**2 + np.cos(lats1) * math.cos(lat2) * np.sin(dlon/2)**2
+        c = 2 * np.arcsin(np.sqrt(a))
+        return R * c
+
     def calculate_distance_factor(self, dist_km: float) -> float:
         """Calculate distance factor based on distance in kilometers."""
         return 1.005 if dist_km <= 20 else 0.995
 
     def calculate_interest_score(self, agent: Dict, event: Dict) -> float:
         """Calculate interest score for an agent for a specific event."""
+        return float(self.calculate_interest_scores([agent], event)[0])
+
+    def agent_location(self, agent_id: str) -> Tuple[float, float]:
+        """Locate an agent at the first POI of its route, defaulting to Westwood center."""
+        agent_info = self.route_by_id.get(agent_id)
+        if agent_info and agent_info.get('poi_sequence'):
+            first_poi = agent_info['poi_sequence'][0]
+            if 'edge' in first_poi:
+                return self._poi_by_edge.get(first_poi['edge'], WESTWOOD_CENTER)
+        return WESTWOOD_CENTER
+
+    def calculate_interest_scores(self, agents: List[Dict], event: Dict) -> np.ndarray:
+        """Calculate interest scores, including the distance factor, for many agents at once."""
+        scores = self._demographic_scores(agents, event)
+        locations = np.array([self.agent_location(agent['id']) for agent in agents], dtype=float).reshape(-1, 2)
+        dists = self.haversine_batch(locations[:, 0], locations[:, 1], event['lat'], event['lon'])
+        return scores * np.where(dists <= 20, 1.005, 0.995)
+
+    def _demographic_scores(self, agents: List[Dict], event: Dict) -> np.ndarray:
+        """Base interest times age, sex or income factors for each agent."""
         event_type = event['type'].lower()
         event_config = self.event_types[event_type]
+        demographics = [agent['demographics'] for agent in agents]
+        
+        ages = np.fromiter((d.get('age', 30) for d in demographics), dtype=np.int64, count=len(agents))
+        scores = np.full(len(agents), event_config['base_interest'])
         
-        # Start with base interest
-        interest = event_config['base_interest']
-
-        # Age factor
-        age = agent['demographics']['age']
         if event_type == "sports":
-            for age_check, factor in event_config['age_factors']:
-                if age_check(age):
-                    interest *= factor
-                    break
-                    
-            # Sex factor for sports
-            sex = agent['demographics']['gender'].upper()
-            interest *= event_config['sex_factors'].get(sex, 1.0)
+            # Apply age and sex factors
+            sex_factors = event_config['sex_factors']
+            scores *= event_config['age_table'][np.clip(ages, 0, MAX_AGE)]
+            scores *= np.fromiter((sex_factors.get(d.get('gender', '').upper(), 1.0) for d in demographics),
+                                  dtype=float, count=len(agents))
             
         elif event_type == "entertainment":
-            for age_check, factor in event_config['age_factors']:
-                if age_check(age):
-                    interest *= factor
-                    break
-                    
-            # Income factor for entertainment
-            income_level = agent['demographics']['income_level']
-            # Convert income level to percentile (this is a simplified conversion)
-            income_percentile = {
-                "Low": 20,
-                "Medium": 50,
-                "High": 90
-            }.get(income_level, 50)
-            interest *= event_config['income_factor'](income_percentile)
-
-        # Distance factor - Updated coordinate extraction logic
-        try:
-            with open('../data/route_info.json', 'r') as f:
-                route_info = json.load(f)
-                agent_info = next((info for info in route_info if info['agent_id'] == agent['id']), None)
-                
-                if agent_info and 'poi_sequence' in agent_info and agent_info['poi_sequence']:
-                    # Try to get coordinates from the first POI in sequence
-                    first_poi = agent_info['poi_sequence'][0]
-                    if 'edge' in first_poi:
-                        # Load POI coordinates from pois.add.xml
-                        try:
-                            import xml.etree.ElementTree as ET
-                            tree = ET.parse('../poi/pois.add.xml')
-                            root = tree.getroot()
-                            
-                            # Find POI with matching edge
-                            for poi in root.findall('poi'):
-                                if poi.get('edge') == first_poi['edge']:
-                                    agent_lat = float(poi.get('lat'))
-                                    agent_lon = float(poi.get('lon'))
-                                    break
-                            else:
-                                # Default to Westwood center if POI not found
-                                agent_lat, agent_lon = 34.0689, -118.4452
-                        except Exception as e:
-                            print(f"Error loading POI coordinates: {e}")
-                            agent_lat, agent_lon = 34.0689, -118.4452
-                    else:
-                        # Default to Westwood center if edge not found
-                        agent_lat, agent_lon = 34.0689, -118.4452
-                else:
-                    # Default to Westwood center if no POI sequence
-                    agent_lat, agent_lon = 34.0689, -118.4452
-                    
-        except Exception as e:
-            print(f"Error loading route info: {e}")
-            # Use default coordinates if unable to load
-            agent_lat, agent_lon = 34.0689, -118.4452  # Default to Westwood center
-
-        dist_km = self.haversine_distance(agent_lat, agent_lon, event['lat'], event['lon'])
-        interest *= self.calculate_distance_factor(dist_km)
-
-        return interest
+            # Apply age and income factors, resolving the income function once per level
+            income_fn = event_config['income_factor']
+            income_factors = {level: income_fn(pct) for level, pct in INCOME_PERCENTILES.items()}
+            default_income = income_fn(50)
+            scores *= event_config['age_table'][np.clip(ages, 0, MAX_AGE)]
+            scores *= np.fromiter((income_factors.get(d.get('income_level', 'Medium'), default_income)
+                                   for d in demographics), dtype=float, count=len(agents))
+        
+        return scores
 
     def select_interested_agents(self, agents: List[Dict], event: Dict, capacity: int) -> List[Dict]:
         """Select the top interested agents based on event capacity."""
-        # Calculate interest scores for all agents (without distance factor)
-        agent_scores = []
-        for agent in agents:
-            # Get base interest and demographic factors
-            event_type = event['type'].lower()
-            event_config = self.event_types[event_type]
-            interest = event_config['base_interest']
-
-            # Get demographics
-            demographics = agent['demographics']
-            age = demographics.get('age', 30)  # default age if not specified
-
-            if event_type == "sports":
-                # Apply age factors
-                for age_check, factor in event_config['age_factors']:
-                    if age_check(age):
-                        interest *= factor
-                        break
-                        
-                # Apply sex factor for sports
-                sex = demographics.get('gender', '').upper()
-                interest *= event_config['sex_factors'].get(sex, 1.0)
-                
-            elif event_type == "entertainment":
-                # Apply age factors
-                for age_check, factor in event_config['age_factors']:
-                    if age_check(age):
-                        interest *= factor
-                        break
-                        
-                # Apply income factor
-                income_level = demographics.get('income_level', 'Medium')
-                income_percentile = {
-                    "Low": 20,
-                    "Medium": 50,
-                    "High": 90
-                }.get(income_level, 50)
-                interest *= event_config['income_factor'](income_percentile)
-
-            agent_scores.append((agent, interest))
-
-        # Sort by interest score and select top agents up to capacity
-        agent_scores.sort(key=lambda x: x[1], reverse=True)
-        selected_agents = [agent for agent, score in agent_scores[:capacity]]
-
-        return selected_agents
+        if not agents or capacity <= 0:
+            return []
+        
+        # Score all agents at once (without distance factor)
+        scores = self._demographic_scores(agents, event)
+        
+        # Keep the capacity highest scores; ties at the cutoff go to earlier agents
+        if capacity < len(agents):
+            cutoff = np.partition(scores, len(agents) - capacity)[len(agents) - capacity]
+            above = np.flatnonzero(scores > cutoff)
+            ties = np.flatnonzero(scores == cutoff)[:capacity - len(above)]
+            candidates = np.sort(np.concatenate((above, ties)))
+        else:
+            candidates = np.arange(len(agents))
+        
+        # Highest score first, original order among equal scores
+        order = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [agents[i] for i in order]
 
     def get_poi_coordinates(self, poi_name: str) -> Tuple[float, float]:
         """Get the coordinates of a POI by name."""
-        try:
-            import xml.etree.ElementTree as ET
-            tree = ET.parse('../poi/pois.add.xml')
-            root = tree.getroot()
-            
-            for poi in root.findall('poi'):
-                if poi.get('name') == poi_name:
-                    return float(poi.get('lat')), float(poi.get('lon'))
-            
-            # Return Westwood center coordinates if POI not foundroute_info_road_closures
-            return 34.0689, -118.4452
-        except Exception as e:
-            print(f"Error getting POI coordinates: {e}")
-            return 34.0689, -118.4452
+        return self._poi_by_name.get(poi_name, WESTWOOD_CENTER)
 
     def handle_affected_agents(self, agents: List[Dict], event: Dict, activity_modifier, prompt: str) -> Dict[str, List[str]]:
         """Modify agents' routes to include the event using parallel processing when possible."""
@@ -215,21 +209,33 @@ class EventHandler:
                 start_quarters = 48  # 12:00
                 duration_quarters = 8  # 2 hours
             
-            for agent in agents:
+            event_timing = {
+                'start_quarter': start_quarters,
+                'duration_quarters': duration_quarters,
+                'start_time': start_time,
+                'duration_hours': duration
+            }
+            
+            # Convert the timing of every agent's activities to quarters in one pass
+            sequences = [agent['route_info']['poi_sequence'] for agent in agents]
+            pois = [poi for sequence in sequences for poi in sequence]
+            poi_start_quarters = (np.asarray([poi.get('start_time', 0) for poi in pois], dtype=np.int32) // 900).tolist()
+            poi_duration_quarters = (np.asarray([poi.get('stop_duration', 3600) for poi in pois], dtype=np.int32) // 900).tolist()
+            
+            offset = 0
+            for agent, sequence in zip(agents, sequences):
                 # Get current activity chain
-                current_chain = [poi['name'] for poi in agent['route_info']['poi_sequence']]
+                current_chain = [poi['name'] for poi in sequence]
                 print(f"Current chain for agent {agent['id']}: {current_chain}")
                 
                 # Get timing information for current activities
-                current_timing = []
-                for poi in agent['route_info']['poi_sequence']:
-                    start_time_sec = poi.get('start_time', 0)
-                    duration_sec = poi.get('stop_duration', 3600)
-                    current_timing.append({
-                        'name': poi['name'],
-                        'start_quarter': start_time_sec // 900,  # Convert seconds to quarters
-                        'duration_quarters': duration_sec // 900  # Convert seconds to quarters
-                    })
+                end = offset + len(sequence)
+                current_timing = [
+                    {'name': name, 'start_quarter': start_quarter, 'duration_quarters': duration_quarter}
+                    for name, start_quarter, duration_quarter in zip(
+                        current_chain, poi_start_quarters[offset:end], poi_duration_quarters[offset:end])
+                ]
+                offset = end
                 
                 agent_data_list.append({
                     'agent_id': agent['id'],
@@ -238,12 +244,7 @@ class EventHandler:
                     'prompt': prompt,
                     'vehicle_data': {
                         **agent,
-                        'event_timing': {
-                            'start_quarter': start_quarters,
-                            'duration_quarters': duration_quarters,
-                            'start_time': start_time,
-                            'duration_hours': duration
-                        }
+                        'event_timing': event_timing
                     },
                     'traffic_info': {}  # Empty for events
                 })
@@ -254,6 +255,8 @@ class EventHandler:
                 return activity_modifier.modify_activity_chains_parallel(agent_data_list)
             
             # Fallback to sequential processing for single agent or if parallel method is not available
+            if hasattr(activity_modifier, 'clear_agent_context_cache'):
+                activity_modifier.clear_agent_context_cache()
             results = {}
             for data in agent_data_list:
                 agent_id = data['agent_id']
@@ -1,25 +1,42 @@
 import xml.etree.ElementTree as ET
 
 def filter_polygons():
-    # Read the original poly file
-    tree = ET.parse('../sumo_config/westwood.poly.xml')
-    root = tree.getroot()
+    # Stream the original poly file instead of loading the whole tree
+    depth = 0
+    root = None
+    pending = None  # last copied polygon, written once its trailing whitespace is parsed
     
-    # Create new XML for polygons only
-    new_root = ET.Element('additional')
-    
-    # Copy only polygon elements (skip POIs)
-    for child in root:
-        if child.tag == 'poly':
-            new_root.append(child)
-    
-    # Write to new file
-    tree = ET.ElementTree(new_root)
     with open('../sumo_config/westwood.landscape.xml', 'wb') as f:
         f.write(b'<?xml version="1.0" encoding="UTF-8"?>\n')
-        tree.write(f, encoding='utf-8')
+        f.write(b'<additional>')
+        
+        for event, elem in ET.iterparse('../sumo_config/westwood.poly.xml', events=('start', 'end')):
+            if event == 'start':
+                depth += 1
+                if root is None:
+                    root = elem
+                elif depth == 2:
+                    if pending is not None:
+                        f.write(ET.tostring(pending, encoding='utf-8'))
+                        pending.clear()
+                        pending = None
+                    # Drop already-handled siblings so the root never accumulates children
+                    del root[:-1]
+                continue
+            
+            depth -= 1
+            if depth == 1:
+                # Copy only polygon elements (skip POIs)
+                if elem.tag == 'poly':
+                    pending = elem
+                else:
+                    elem.clear()
+        
+        if pending is not None:
+            f.write(ET.tostring(pending, encoding='utf-8'))
+        f.write(b'</additional>')
     
     print("Created landscape file without POIs")
 
 if __name__ == '__main__':
-    filter_polygons() 
\ No newline at end of file
+    filter_polygons()
\ No newline at end of file
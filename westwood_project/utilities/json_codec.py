@@ -0,0 +1,27 @@
+"""
+JSON helpers that use orjson when it is installed and fall back to the
+standard library json module otherwise.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(data):
+    """Parse JSON from a str, bytes, bytearray or memoryview"""
+    if orjson is not None:
+        return orjson.loads(data)
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)
+
+
+def dumps(obj):
+    """Serialize obj to compact UTF-8 encoded JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
@@ -0,0 +1,83 @@
+"""
+Persistent on-disk cache of LLM-generated activity chains, keyed on the
+full input state so repeated situations skip the API call across runs.
+Set MOBIVERSE_LLM_CACHE=0 to disable it.
+
+The shelf is opened on first use rather than on construction, so only the
+process that actually runs closures (dynamic_control) holds it; dbm
+backends do not support two processes writing the same file.
+"""
+
+import hashlib
+import json
+import os
+import shelve
+import threading
+
+CACHE_PATH = '../cache/llm_chains.db'
+ENABLED = os.environ.get('MOBIVERSE_LLM_CACHE', '1') != '0'
+
+
+def make_key(current_chain, situation, demographics, closed_edges, poi_sequence):
+    """Stable digest of everything that determines an agent's new chain"""
+    state = {
+        'chain': current_chain,
+        'sit': situation,
+        'demo': demographics,
+        'closed': sorted(closed_edges),
+        'pois': poi_sequence
+    }
+    payload = json.dumps(state, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class LLMChainCache:
+    """Shelve-backed store of (new_chain, durations) results; a no-op when it can't be opened"""
+
+    def __init__(self, path=CACHE_PATH):
+        self._lock = threading.Lock()
+        self._path = path
+        self._db = None
+        # Only one attempt is made to open the shelf; after a failure or close() it stays a no-op
+        self._tried = not ENABLED
+
+    def _open(self):
+        """Open the shelf on first use; must be called with the lock held"""
+        if self._tried:
+            return self._db
+        self._tried = True
+        try:
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            self._db = shelve.open(self._path)
+        except Exception as e:
+            print(f"LLM chain cache disabled, could not open {self._path}: {e}")
+        return self._db
+
+    def get(self, key):
+        """Return the cached (new_chain, durations) for key, or None"""
+        with self._lock:
+            db = self._open()
+            return None if db is None else db.get(key)
+
+    def set(self, key, new_chain, durations):
+        """Store a successful result; empty chains or durations are not cached"""
+        if not new_chain or not durations:
+            return
+        with self._lock:
+            db = self._open()
+            if db is not None:
+                db[key] = (list(new_chain), list(durations))
+
+    def sync(self):
+        """Flush pending writes to disk"""
+        with self._lock:
+            if self._db is not None:
+                self._db.sync()
+
+    def close(self):
+        """Close the underlying shelf"""
+        with self._lock:
+            self._tried = True
+            if self._db is not None:
+                self._db.close()
+                self._db = None
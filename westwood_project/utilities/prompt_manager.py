@@ -1,3 +1,67 @@
+from collections import defaultdict
+from functools import lru_cache
+
+ROAD_CLOSURE_TEMPLATE = (
+    "Roads {closed_edges} are closed. "
+    "The following destinations are no longer accessible: {affected_pois}. "
+    "Alternative locations you might consider: {alternatives} "
+    "Please suggest an alternative route that avoids these locations while maintaining "
+    "the general purpose of the trip."
+)
+
+EVENT_HEAD_TEMPLATE = (
+    "A {type} event is happening at {location} in Westwood, Los Angeles. "
+    "The event details:\n"
+    "- Type: {type}\n"
+    "- Event Name: {name}\n"
+    "- Location: {location}\n"
+    "- Start Time: {start_time}\n"
+    "- End Time: {end_time}\n"
+    "- Duration: {duration} hours\n\n"
+)
+
+EVENT_DEMOGRAPHICS_TEMPLATE = (
+    "Agent demographics:\n"
+    "- Age: {age}\n"
+    "- Gender: {gender}\n"
+    "- Student Status: {student_status}\n"
+    "- Income Level: {income_level}\n\n"
+)
+
+EVENT_TAIL_TEMPLATE = (
+    "Please modify the agent's current activity chain to include this event at the specified time ({start_time}-{end_time}), "
+    "considering the agent's demographics and existing activities. Make sure to adjust or reschedule any conflicting activities "
+    "to accommodate the event during its scheduled time."
+)
+
+ROUTE_MODIFICATION_TEMPLATE = (
+    "Current activity chain: {current_chain}\n"
+    "Traffic conditions: {traffic_status}\n"
+    "Situation: {situation}\n"
+    "Please suggest an optimized activity chain considering the situation and traffic conditions."
+)
+
+@lru_cache(maxsize=64)
+def _event_text(event_type, name, location, start_time, duration):
+    """Per-event parts of the event prompt, built once and shared by every agent"""
+    # Calculate end time
+    try:
+        start_hour = int(start_time.split(':')[0])
+        end_hour = (start_hour + duration) % 24
+        end_time = f"{end_hour:02d}:00"
+    except:
+        end_time = "14:00"  # Default 2 hours after default start
+    
+    fields = {
+        'type': event_type,
+        'name': name,
+        'location': location,
+        'start_time': start_time,
+        'end_time': end_time,
+        'duration': duration
+    }
+    return EVENT_HEAD_TEMPLATE.format_map(fields), EVENT_TAIL_TEMPLATE.format_map(fields)
+
 class PromptManager:
     def __init__(self):
         self.prompts = {
@@ -8,55 +72,32 @@ class PromptManager:
 
     def road_closure_prompt(self, closed_edges, affected_pois, alternatives):
         """Generate prompt for road closure situation"""
-        return (
-            f"Roads {', '.join(closed_edges)} are closed. "
-            f"The following destinations are no longer accessible: {', '.join(affected_pois)}. "
-            f"Alternative locations you might consider: {alternatives} "
-            f"Please suggest an alternative route that avoids these locations while maintaining "
-            f"the general purpose of the trip."
+        return ROAD_CLOSURE_TEMPLATE.format(
+            closed_edges=', '.join(closed_edges),
+            affected_pois=', '.join(affected_pois),
+            alternatives=alternatives
         )
 
     def event_creation_prompt(self, event_data, agent_demographics):
         """Generate prompt for event creation"""
-        # Format time information
-        start_time = event_data.get('start_time', '12:00')
-        duration = event_data.get('duration', 2)
-        
-        # Calculate end time
-        try:
-            start_hour = int(start_time.split(':')[0])
-            end_hour = (start_hour + duration) % 24
-            end_time = f"{end_hour:02d}:00"
-        except:
-            end_time = "14:00"  # Default 2 hours after default start
-        
-        return (
-            f"A {event_data['type']} event is happening at {event_data['location']} in Westwood, Los Angeles. "
-            f"The event details:\n"
-            f"- Type: {event_data['type']}\n"
-            f"- Event Name: {event_data['name']}\n"
-            f"- Location: {event_data['location']}\n"
-            f"- Start Time: {start_time}\n"
-            f"- End Time: {end_time}\n"
-            f"- Duration: {duration} hours\n\n"
-            f"Agent demographics:\n"
-            f"- Age: {agent_demographics.get('age', 'unknown')}\n"
-            f"- Gender: {agent_demographics.get('gender', 'unknown')}\n"
-            f"- Student Status: {agent_demographics.get('student_status', 'unknown')}\n"
-            f"- Income Level: {agent_demographics.get('income_level', 'unknown')}\n\n"
-            f"Please modify the agent's current activity chain to include this event at the specified time ({start_time}-{end_time}), "
-            f"considering the agent's demographics and existing activities. Make sure to adjust or reschedule any conflicting activities "
-            f"to accommodate the event during its scheduled time."
+        # Event fields are formatted once per event; only demographics vary per agent
+        head, tail = _event_text(
+            event_data['type'],
+            event_data['name'],
+            event_data['location'],
+            event_data.get('start_time', '12:00'),
+            event_data.get('duration', 2)
         )
+        demographics = EVENT_DEMOGRAPHICS_TEMPLATE.format_map(defaultdict(lambda: 'unknown', agent_demographics))
+        return head + demographics + tail
 
     def route_modification_prompt(self, current_chain, situation, traffic_info):
         """Generate prompt for general route modification"""
         traffic_status = self.format_traffic_info(traffic_info)
-        return (
-            f"Current activity chain: {', '.join(current_chain)}\n"
-            f"Traffic conditions: {traffic_status}\n"
-            f"Situation: {situation}\n"
-            f"Please suggest an optimized activity chain considering the situation and traffic conditions."
+        return ROUTE_MODIFICATION_TEMPLATE.format(
+            current_chain=', '.join(current_chain),
+            traffic_status=traffic_status,
+            situation=situation
         )
 
     def format_traffic_info(self, traffic_info):
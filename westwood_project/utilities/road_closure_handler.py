@@ -1,16 +1,115 @@
 import xml.etree.ElementTree as ET
-import json
+import os
 from .activity_chain_modifier import ActivityChainModifier
+from . import llm_cache
+from . import json_codec
 import traci
+import traci.constants as tc
 import sumolib
 import pyproj
 import math
+import numpy as np
+from functools import lru_cache
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# Network offset constants
+NET_OFFSET_X = -365398.86
+NET_OFFSET_Y = -3768588.46
+
+WGS84_CRS = "+proj=longlat +ellps=WGS84 +datum=WGS84 +no_defs"
+UTM_CRS = "+proj=utm +zone=11 +ellps=WGS84 +datum=WGS84 +units=m +no_defs"
+
+@lru_cache(maxsize=32)
+def _get_transformer(src_crs, dst_crs):
+    """Construct a pyproj Transformer once per CRS pair; building one is far more expensive than using it"""
+    return pyproj.Transformer.from_crs(src_crs, dst_crs, always_xy=True)
+
+_TRANSFORMER = _get_transformer(WGS84_CRS, UTM_CRS)
+
+def _min_segment_distances_numpy(px, py, ax, ay, dx, dy, seg_len2):
+    """Distance from each point to the nearest of the segments a + t*d, t in [0, 1]"""
+    # Clamped projection of every point onto every segment (points x segments),
+    # matching sumolib.geomhelper.distancePointToLine
+    px = px[:, None]
+    py = py[:, None]
+    dot = (px - ax) * dx + (py - ay) * dy
+    t = np.divide(dot, seg_len2, out=np.zeros_like(dot), where=seg_len2 > 0)
+    np.clip(t, 0.0, 1.0, out=t)
+    return np.hypot(px - (ax + t * dx), py - (ay + t * dy)).min(axis=1)
+
+if njit is not None:
+    @njit(cache=True, fastmath=True)
+    def _min_segment_distances(px, py, ax, ay, dx, dy, seg_len2):
+        """Compiled version of _min_segment_distances_numpy without the points x segments temporaries"""
+        out = np.empty(px.shape[0])
+        for i in range(px.shape[0]):
+            best = np.inf
+            for j in range(ax.shape[0]):
+                t = 0.0
+                if seg_len2[j] > 0:
+                    t = ((px[i] - ax[j]) * dx[j] + (py[i] - ay[j]) * dy[j]) / seg_len2[j]
+                    t = min(1.0, max(0.0, t))
+                ex = px[i] - (ax[j] + t * dx[j])
+                ey = py[i] - (ay[j] + t * dy[j])
+                dist = math.sqrt(ex * ex + ey * ey)
+                if dist < best:
+                    best = dist
+            out[i] = best
+        return out
+else:
+    _min_segment_distances = _min_segment_distances_numpy
+
+ROUTE_INFO_PATH = '../data/route_info.json'
+NET_FILE = '../sumo_config/westwood.net.xml'
+
+@lru_cache(maxsize=2)
+def _load_net(path, mtime):
+    """Parse the SUMO network once per (path, mtime) and share it between handlers"""
+    return sumolib.net.readNet(path)
+
+@lru_cache(maxsize=None)
+def _agent_number(agent_id):
+    """Numeric part of an 'agent_<n>' id, parsed once per id"""
+    return int(agent_id.split('_')[1])
+
+def _poi_sets(agent_info):
+    """Frozensets of the POI names and edges an agent visits"""
+    poi_sequence = agent_info['poi_sequence']
+    return frozenset(poi['name'] for poi in poi_sequence), frozenset(poi['edge'] for poi in poi_sequence)
+
+@lru_cache(maxsize=4)
+def _load_route_info(path, mtime):
+    """Parse route info, index it by agent id (first entry wins) and precompute each agent's POI sets"""
+    with open(path, 'rb') as f:
+        route_info = json_codec.loads(f.read())
+    route_by_id = {}
+    for info in route_info:
+        route_by_id.setdefault(info['agent_id'], info)
+    poi_sets = [_poi_sets(info) for info in route_info]
+    return route_info, route_by_id, poi_sets
+
+def load_route_info(path=ROUTE_INFO_PATH):
+    """Return (route_info, route_by_id, poi_sets), re-reading the file only when its mtime changes"""
+    return _load_route_info(path, os.path.getmtime(path))
 
 class RoadClosureHandler:
     def __init__(self):
         self.closed_edges = set()
         self.pois = self.load_pois()
-        self.net = sumolib.net.readNet('../sumo_config/westwood.net.xml')
+        self.pois_by_edge = {}
+        for poi in self.pois:
+            self.pois_by_edge.setdefault(poi['edge'], []).append(poi)
+        self._build_poi_arrays()
+        self.net = _load_net(NET_FILE, os.path.getmtime(NET_FILE))
+        self.llm_cache = llm_cache.LLMChainCache()
+        # Edges with an occupancy subscription, and the TraCI connection they were made on
+        self._subscribed_edges = set()
+        self._subscription_conn = None
+        self._edge_ids = None  # network edge ids, fetched once per TraCI connection
+        self._edge_segments = {}  # edge id -> (ax, ay, dx, dy, seg_len2), or None for degenerate shapes
         
     def load_pois(self):
         """Load POIs from XML file"""
@@ -34,6 +133,23 @@ class RoadClosureHandler:
             print(f"Error loading POIs: {e}")
             return []
 
+    def _build_poi_arrays(self):
+        """Project all POIs into network coordinates once, as arrays for vectorized distance checks"""
+        lons = np.array([poi['lon'] for poi in self.pois], dtype=float)
+        lats = np.array([poi['lat'] for poi in self.pois], dtype=float)
+        xs, ys = _TRANSFORMER.transform(lons, lats)
+        xs = np.asarray(xs, dtype=float) + NET_OFFSET_X
+        ys = np.asarray(ys, dtype=float) + NET_OFFSET_Y
+        
+        # Drop POIs whose coordinates or projection are invalid once, here, instead of per call
+        valid = np.isfinite(lons) & np.isfinite(lats) & np.isfinite(xs) & np.isfinite(ys)
+        if not valid.all():
+            print(f"Skipping {int((~valid).sum())} POIs with invalid coordinates")
+        self._poi_index = np.flatnonzero(valid)
+        self._poi_x = xs[valid]
+        self._poi_y = ys[valid]
+        self._poi_edges = np.array([poi['edge'] for poi in self.pois], dtype=object)[valid]
+
     def close_roads(self, edge_ids):
         """Close specified road edges and identify affected POIs"""
         affected_pois = set()
@@ -47,7 +163,7 @@ class RoadClosureHandler:
                     print(f"Closed edge: {edge_id}")
                     
                     # Find POIs on this edge
-                    edge_pois = [poi['name'] for poi in self.pois if poi['edge'] == edge_id]
+                    edge_pois = [poi['name'] for poi in self.pois_by_edge.get(edge_id, ())]
                     affected_pois.update(edge_pois)
                     
                 except traci.exceptions.TraCIException as e:
@@ -70,80 +186,80 @@ class RoadClosureHandler:
                     except traci.exceptions.TraCIException as e:
                         print(f"Error reopening edge {edge_id}: {e}")
                         continue
+            
+            # Occupancy is only needed while something is closed
+            if not self.closed_edges:
+                self._unsubscribe_edge_occupancy()
             return True
         except Exception as e:
             print(f"Error reopening roads: {e}")
             return False
 
+    def _get_edge_segments(self, edge_id):
+        """Contiguous segment start points, direction vectors and squared lengths of an edge, computed once"""
+        if edge_id in self._edge_segments:
+            return self._edge_segments[edge_id]
+        
+        shape = np.asarray(self.net.getEdge(edge_id).getShape(), dtype=float)
+        segments = None
+        if len(shape) >= 2:
+            ax = np.ascontiguousarray(shape[:-1, 0])
+            ay = np.ascontiguousarray(shape[:-1, 1])
+            dx = shape[1:, 0] - ax
+            dy = shape[1:, 1] - ay
+            segments = (ax, ay, dx, dy, dx * dx + dy * dy)
+        self._edge_segments[edge_id] = segments
+        return segments
+
     def find_nearby_pois(self, edge_id, max_distance=500):
         """Find POIs that are near a given edge but not on it"""
         try:
-            # Get the coordinates of the edge
-            edge = self.net.getEdge(edge_id)
-            edge_coords = edge.getShape()
-            
-            # Network offset constants
-            net_offset_x = -365398.86
-            net_offset_y = -3768588.46
+            # Get the cached segment geometry of the edge
+            segments = self._get_edge_segments(edge_id)
+            if segments is None or not len(self._poi_index):
+                return []
             
-            # Set up coordinate transformers
-            utm_proj = pyproj.Proj("+proj=utm +zone=11 +ellps=WGS84 +datum=WGS84 +units=m +no_defs")
-            wgs84_proj = pyproj.Proj("+proj=longlat +ellps=WGS84 +datum=WGS84 +no_defs")
-            transformer = pyproj.Transformer.from_proj(wgs84_proj, utm_proj)
-            
-            nearby_pois = []
-            for poi in self.pois:
-                if poi['edge'] == edge_id:
-                    continue
-                
-                try:
-                    # Convert POI coordinates
-                    poi_x, poi_y = transformer.transform(poi['lon'], poi['lat'])
-                    poi_x += net_offset_x
-                    poi_y += net_offset_y
-                    
-                    # Calculate minimum distance to edge
-                    min_distance = float('inf')
-                    for i in range(len(edge_coords) - 1):
-                        distance = sumolib.geomhelper.distancePointToLine(
-                            (poi_x, poi_y),
-                            edge_coords[i],
-                            edge_coords[i + 1]
-                        )
-                        min_distance = min(min_distance, distance)
-                    
-                    if min_distance <= max_distance:
-                        nearby_pois.append({
-                            'name': poi['name'],
-                            'type': poi['type'],
-                            'distance': min_distance
-                        })
-                except Exception as e:
-                    print(f"Error processing POI {poi['name']}: {e}")
-                    continue
+            distances = _min_segment_distances(self._poi_x, self._poi_y, *segments)
             
-            # Sort by distance
-            nearby_pois.sort(key=lambda x: x['distance'])
-            return nearby_pois
+            # Keep POIs near but not on the edge, sorted by distance
+            candidates = np.flatnonzero((distances <= max_distance) & (self._poi_edges != edge_id))
+            candidates = candidates[np.argsort(distances[candidates], kind='stable')]
+            return [
+                {
+                    'name': self.pois[self._poi_index[i]]['name'],
+                    'type': self.pois[self._poi_index[i]]['type'],
+                    'distance': float(distances[i])
+                }
+                for i in candidates
+            ]
             
         except Exception as e:
             print(f"Error finding nearby POIs: {e}")
             return []
 
-    def find_affected_agents(self, route_info, affected_pois, closed_edges, current_vehicles):
+    def find_affected_agents(self, route_info, affected_pois, closed_edges, current_vehicles, poi_sets=None):
         """Find agents affected by road closures or POI changes"""
         affected_agents = {}
-        max_current_id = max([int(v.split('_')[1]) for v in current_vehicles if v.startswith('agent_')], default=0)
+        max_current_id = max((_agent_number(v) for v in current_vehicles if v.startswith('agent_')), default=0)
         print(f"Max current ID: {max_current_id}")
         
-        for agent_info in route_info:
+        affected_pois = frozenset(affected_pois)
+        closed_edges = frozenset(closed_edges)
+        if poi_sets is None:
+            poi_sets = [_poi_sets(info) for info in route_info]
+        
+        for agent_info, (poi_names, poi_edge_set) in zip(route_info, poi_sets):
+            # Skip agents that visit none of the affected POIs or closed edges
+            if poi_names.isdisjoint(affected_pois) and poi_edge_set.isdisjoint(closed_edges):
+                continue
+            
             agent_id = agent_info['agent_id']
             
             if not agent_id.startswith('agent_'):
                 continue
             
             try:
-                agent_id_num = int(agent_id.split('_')[1])
+                agent_id_num = _agent_number(agent_id)
                 is_pending = agent_id_num > max_current_id
             except (IndexError, ValueError):
                 continue
@@ -152,37 +268,39 @@ class RoadClosureHandler:
             poi_edges = [poi['edge'] for poi in agent_info['poi_sequence']]
             
             affected_pois_for_agent = [poi for poi in poi_sequence if poi in affected_pois]
-            affected_by_closed_edges = any(edge in closed_edges for edge in poi_edges)
             
-            if affected_pois_for_agent or affected_by_closed_edges:
-                try:
-                    if not is_pending:
-                        current_edge = traci.vehicle.getRoadID(agent_id)
-                        route = traci.vehicle.getRoute(agent_id)
-                        route_index = traci.vehicle.getRouteIndex(agent_id)
-                    else:
-                        current_edge = poi_edges[0]
-                        route = []
-                        route_index = 0
-                    
-                    affected_agents[agent_id] = {
-                        'current_edge': current_edge,
-                        'route': route,
-                        'route_index': route_index,
-                        'affected_pois': affected_pois_for_agent,
-                        'closed_edges': [edge for edge in poi_edges if edge in closed_edges],
-                        'current_chain': poi_sequence,
-                        'demographics': agent_info.get('demographics', {}),
-                        'is_pending': is_pending
-                    }
-                    print(f"Agent {agent_id} affected by closure. Status: {'Pending' if is_pending else 'Active'}")
-                    
-                except traci.exceptions.TraCIException as e:
-                    print(f"Error getting route info for agent {agent_id}: {e}")
-                    continue
+            try:
+                if not is_pending:
+                    current_edge = traci.vehicle.getRoadID(agent_id)
+                    route = traci.vehicle.getRoute(agent_id)
+                    route_index = traci.vehicle.getRouteIndex(agent_id)
+                else:
+                    current_edge = poi_edges[0]
+                    route = []
+                    route_index = 0
+                
+                affected_agents[agent_id] = {
+                    'current_edge': current_edge,
+                    'route': route,
+                    'route_index': route_index,
+                    'affected_pois': affected_pois_for_agent,
+                    'closed_edges': list(poi_edge_set & closed_edges),
+                    'current_chain': poi_sequence,
+                    'demographics': agent_info.get('demographics', {}),
+                    'is_pending': is_pending
+                }
+                print(f"Agent {agent_id} affected by closure. Status: {'Pending' if is_pending else 'Active'}")
+                
+            except traci.exceptions.TraCIException as e:
+                print(f"Error getting route info for agent {agent_id}: {e}")
+                continue
         
         return affected_agents
 
+    def close(self):
+        """Release the on-disk LLM chain cache"""
+        self.llm_cache.close()
+
     def get_closed_edges(self):
         """Return the set of currently closed edges"""
         return self.closed_edges
@@ -195,8 +313,7 @@ class RoadClosureHandler:
         """Handle agents affected by road closures"""
         try:
             # Load route information for all agents
-            with open('../data/route_info.json', 'r') as f:
-                route_info = json.load(f)
+            route_info, route_by_id, poi_sets = load_route_info()
 
             # Get current vehicles and find affected agents
             current_vehicles = set(traci.vehicle.getIDList())
@@ -204,44 +321,56 @@ class RoadClosureHandler:
                 route_info, 
                 affected_pois, 
                 closed_edges, 
-                current_vehicles
+                current_vehicles,
+                poi_sets
             )
 
             # Filter agents to only include those with IDs less than 200
             affected_agents = {
                 k: v for k, v in affected_agents.items() 
-                if k.startswith('agent_') and int(k.split('_')[1]) < 10000
+                if k.startswith('agent_') and _agent_number(k) < 10000
             }
             
             # Process affected agents
             if affected_agents:
                 print(f"Found {len(affected_agents)} affected agents")
-                self.process_affected_agents(affected_agents, situation, activity_modifier, change_agent_route)
+                self.process_affected_agents(affected_agents, situation, activity_modifier, change_agent_route, route_by_id)
             else:
                 print("No agents affected by the road closure")
 
         except Exception as e:
             print(f"Error handling affected agents: {e}")
 
-    def process_affected_agents(self, affected_agents, situation, activity_modifier, change_agent_route):
+    def process_affected_agents(self, affected_agents, situation, activity_modifier, change_agent_route, route_by_id=None):
         """Process each affected agent with the LLM"""
+        traffic_info = None
         try:
-            # Load route information for all agents
-            with open('../data/route_info.json', 'r') as f:
-                route_info = json.load(f)
+            # Route information for all agents, indexed by agent id
+            if route_by_id is None:
+                _, route_by_id, _ = load_route_info()
             
-            # Get traffic information
-            traffic_info = self.get_traffic_info()
+            # Get traffic information for the edges the affected agents are on or heading to
+            traffic_info = self.get_traffic_info(self._agent_route_edges(affected_agents))
             
-            # Prepare data for batch processing
+            # Prepare data for batch processing, reusing cached chains for repeated situations
             agent_data_list = []
+            results = {}
+            cache_keys = {}
             for agent_id, agent_data in affected_agents.items():
                 # Get the full route info for this agent
-                agent_route_info = next((info for info in route_info if info['agent_id'] == agent_id), None)
+                agent_route_info = route_by_id.get(agent_id)
                 if not agent_route_info:
                     print(f"Warning: No route info found for agent {agent_id}")
                     continue
                 
+                key = llm_cache.make_key(agent_data['current_chain'], situation, agent_data['demographics'],
+                                         self.closed_edges, agent_route_info['poi_sequence'])
+                cached = self.llm_cache.get(key)
+                if cached is not None:
+                    results[agent_id] = cached
+                    continue
+                cache_keys[agent_id] = key
+                
                 agent_data_list.append({
                     'agent_id': agent_id,
                     'current_chain': agent_data['current_chain'],
@@ -258,9 +387,18 @@ class RoadClosureHandler:
                     'traffic_info': traffic_info
                 })
             
-            # Process all affected agents in parallel
-            print(f"Processing {len(agent_data_list)} affected agents in parallel...")
-            results = activity_modifier.modify_activity_chains_parallel(agent_data_list)
+            if results:
+                print(f"Reusing cached chains for {len(results)} affected agents")
+            
+            # Process the remaining affected agents in parallel
+            if agent_data_list:
+                print(f"Processing {len(agent_data_list)} affected agents in parallel...")
+                new_results = activity_modifier.modify_activity_chains_parallel(agent_data_list)
+                for agent_id, (new_chain, durations) in new_results.items():
+                    if agent_id in cache_keys:
+                        self.llm_cache.set(cache_keys[agent_id], new_chain, durations)
+                self.llm_cache.sync()
+                results.update(new_results)
             
             # Apply the results
             success_count = 0
@@ -278,42 +416,52 @@ class RoadClosureHandler:
         except Exception as e:
             print(f"Error in parallel processing of affected agents: {e}")
             # Fallback to sequential processing
-            self._sequential_process_agents(affected_agents, situation, activity_modifier, change_agent_route, traffic_info)
+            self._sequential_process_agents(affected_agents, situation, activity_modifier, change_agent_route,
+                                            traffic_info, route_by_id)
             
-    def _sequential_process_agents(self, affected_agents, situation, activity_modifier, change_agent_route, traffic_info=None):
+    def _sequential_process_agents(self, affected_agents, situation, activity_modifier, change_agent_route,
+                                   traffic_info=None, route_by_id=None):
         """Fallback method for sequential processing"""
+        activity_modifier.clear_agent_context_cache()
         try:
-            # Load route information for all agents
-            with open('../data/route_info.json', 'r') as f:
-                route_info = json.load(f)
+            # Route information for all agents, indexed by agent id
+            if route_by_id is None:
+                _, route_by_id, _ = load_route_info()
                 
             if traffic_info is None:
-                traffic_info = self.get_traffic_info()
+                traffic_info = self.get_traffic_info(self._agent_route_edges(affected_agents))
                 
             for agent_id, agent_data in affected_agents.items():
                 try:
                     # Get the full route info for this agent
-                    agent_route_info = next((info for info in route_info if info['agent_id'] == agent_id), None)
+                    agent_route_info = route_by_id.get(agent_id)
                     if not agent_route_info:
                         print(f"Warning: No route info found for agent {agent_id}")
                         continue
                     
-                    # Use activity modifier with the generated prompt
-                    new_chain, durations = activity_modifier.modify_activity_chain_with_llm(
-                        agent_id,
-                        agent_data['current_chain'],
-                        situation,
-                        {
-                            'current_edge': agent_data['current_edge'],
-                            'route': agent_data['route'],
-                            'route_index': agent_data['route_index'],
-                            'route_info': {
-                                'demographics': agent_data['demographics'],
-                                'poi_sequence': agent_route_info['poi_sequence']
-                            }
-                        },
-                        traffic_info
-                    )
+                    key = llm_cache.make_key(agent_data['current_chain'], situation, agent_data['demographics'],
+                                             self.closed_edges, agent_route_info['poi_sequence'])
+                    cached = self.llm_cache.get(key)
+                    if cached is not None:
+                        new_chain, durations = cached
+                    else:
+                        # Use activity modifier with the generated prompt
+                        new_chain, durations = activity_modifier.modify_activity_chain_with_llm(
+                            agent_id,
+                            agent_data['current_chain'],
+                            situation,
+                            {
+                                'current_edge': agent_data['current_edge'],
+                                'route': agent_data['route'],
+                                'route_index': agent_data['route_index'],
+                                'route_info': {
+                                    'demographics': agent_data['demographics'],
+                                    'poi_sequence': agent_route_info['poi_sequence']
+                                }
+                            },
+                            traffic_info
+                        )
+                        self.llm_cache.set(key, new_chain, durations)
 
                     if new_chain:
                         # Use the passed change_agent_route function with durations
@@ -324,31 +472,85 @@ class RoadClosureHandler:
 
                 except Exception as e:
                     print(f"Error processing agent {agent_id}: {e}")
+            
+            self.llm_cache.sync()
                     
         except Exception as e:
             print(f"Error loading route info: {e}")
 
-    def get_traffic_info(self):
-        """Get basic traffic information (occupancy and congestion status) for all edges"""
+    @staticmethod
+    def _agent_route_edges(affected_agents):
+        """Current and remaining route edges of the affected agents, the only edges their prompts look at"""
+        edges = set()
+        for agent_data in affected_agents.values():
+            edges.add(agent_data['current_edge'])
+            edges.update(agent_data['route'][agent_data['route_index']:])
+        edges.discard('')
+        return edges
+
+    def _known_edge_ids(self):
+        """Edge ids of the loaded network, fetched from TraCI once per connection"""
+        # Subscriptions and the id list do not survive a new TraCI connection
+        conn = traci.getConnection()
+        if conn is not self._subscription_conn:
+            self._subscribed_edges.clear()
+            self._subscription_conn = conn
+            self._edge_ids = None
+        if self._edge_ids is None:
+            self._edge_ids = frozenset(traci.edge.getIDList())
+        return self._edge_ids
+
+    def _subscribe_edge_occupancy(self, edge_ids):
+        """Subscribe the known edges among edge_ids to their occupancy and return that set"""
+        # Unknown ids would make SUMO reject the subscription
+        edge_ids = self._known_edge_ids().intersection(edge_ids)
+        
+        for edge in edge_ids:
+            if edge not in self._subscribed_edges:
+                traci.edge.subscribe(edge, [tc.LAST_STEP_OCCUPANCY])
+                # Only recorded once SUMO accepted it, so a failure is retried next time
+                self._subscribed_edges.add(edge)
+        return edge_ids
+
+    def _unsubscribe_edge_occupancy(self):
+        """Drop all occupancy subscriptions so later steps don't pay for them"""
+        try:
+            if self._subscription_conn is not traci.getConnection():
+                # A new connection starts without any of our subscriptions
+                self._subscribed_edges.clear()
+            for edge in list(self._subscribed_edges):
+                traci.edge.unsubscribe(edge)
+                self._subscribed_edges.discard(edge)
+        except Exception as e:
+            # Edges still listed are retried on the next reopen
+            print(f"Error removing edge subscriptions: {e}")
+
+    def get_traffic_info(self, edge_ids):
+        """Get basic traffic information (occupancy and congestion status) for the given edges
+
+        Callers pass only the affected agents' current and remaining route edges,
+        so congestion elsewhere in the network no longer reaches the LLM prompts.
+        """
         traffic_info = {}
         try:
-            edges = traci.edge.getIDList()
+            edge_ids = self._subscribe_edge_occupancy(edge_ids)
             
-            for edge in edges:
-                try:
-                    occupancy = traci.edge.getLastStepOccupancy(edge)
-                    is_congested = occupancy > 0.5
-                    
-                    # Only include edges with significant traffic
-                    if is_congested or occupancy > 0.3:
-                        traffic_info[edge] = {
-                            'occupancy': occupancy,
-                            'is_congested': is_congested
-                        }
-                except traci.exceptions.TraCIException:
+            # One batch of subscription results instead of a TraCI round-trip per edge
+            results = traci.edge.getAllSubscriptionResults()
+            for edge in edge_ids:
+                occupancy = results.get(edge, {}).get(tc.LAST_STEP_OCCUPANCY)
+                if occupancy is None:
                     continue
+                is_congested = occupancy > 0.5
+                
+                # Only include edges with significant traffic
+                if is_congested or occupancy > 0.3:
+                    traffic_info[edge] = {
+                        'occupancy': occupancy,
+                        'is_congested': is_congested
+                    }
                 
         except Exception as e:
             print(f"Error getting traffic info: {e}")
         
-        return traffic_info 
\ No newline at end of file
+        return traffic_info
\ No newline at end of file
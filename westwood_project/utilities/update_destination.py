@@ -1,32 +1,49 @@
-import json
+import os
 import random
-import time
+from functools import lru_cache
+try:
+    from . import json_codec
+except ImportError:
+    import json_codec  # run directly as a script from utilities/
+
+# Append-only JSON lines, one update per line
+UPDATES_PATH = '../data/destination_updates.jsonl'
+POI_PATH = '../poi/matched_pois.json'
+
+def update_agent_destinations(records):
+    # One append for the whole batch
+    with open(UPDATES_PATH, 'ab') as f:
+        f.writelines(json_codec.dumps(record) + b'\n' for record in records)
 
 def update_agent_destination(agent_id, destination_name):
-    try:
-        with open('../data/destination_updates.json', 'r') as f:
-            updates = json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        updates = []
-    
-    updates.append({
+    update_agent_destinations([{
         "agent_id": f"agent_{agent_id}",
         "destination": destination_name
-    })
-    
-    with open('../data/destination_updates.json', 'w') as f:
-        json.dump(updates, f, indent=2)
+    }])
+
+def load_destination_updates():
+    try:
+        with open(UPDATES_PATH, 'rb') as f:
+            return [json_codec.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+@lru_cache(maxsize=1)
+def _destinations(mtime):
+    with open(POI_PATH, 'rb') as f:
+        pois = json_codec.loads(f.read())
+    return tuple(poi['name'] for poi in pois)
 
 def get_available_destinations():
-    with open('../poi/matched_pois.json', 'r') as f:
-        pois = json.load(f)
-    return [poi['name'] for poi in pois]
+    # Re-parsed only when the POI file changes
+    return _destinations(os.path.getmtime(POI_PATH))
 
 def main():
     destinations = get_available_destinations()
     print("Available destinations:", destinations)
     
     while True:
+        destinations = get_available_destinations()
         print("\nOptions:")
         print("1. Update single agent")
         print("2. Update random agents")
@@ -46,12 +63,13 @@ def main():
         
         elif choice == '2':
             num_updates = int(input("How many random updates to generate? "))
-            for _ in range(num_updates):
-                agent_id = random.randint(0, 19)
-                dest = random.choice(destinations)
-                update_agent_destination(agent_id, dest)
-                print(f"Updated agent_{agent_id} destination to {dest}")
-                time.sleep(0.5)  # Small delay between updates
+            records = [{
+                "agent_id": f"agent_{random.randint(0, 19)}",
+                "destination": random.choice(destinations)
+            } for _ in range(num_updates)]
+            update_agent_destinations(records)
+            for record in records:
+                print(f"Updated {record['agent_id']} destination to {record['destination']}")
         
         elif choice == '3':
             print("\nAvailable destinations:")